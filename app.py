@@ -1,8 +1,13 @@
-from flask import Flask, render_template, request, g, make_response, get_flashed_messages, flash, json, redirect, url_for
+from flask import Flask, render_template, request, make_response, get_flashed_messages, flash, json, redirect, url_for, session
 from datetime import date, datetime, timedelta
+import functools
+import glob
+import hashlib
 import notifications  # Import the entire module instead of specific function
+import metrics
 from db import *
 from dotenv import load_dotenv
+import click
 import os
 
 load_dotenv()
@@ -11,15 +16,107 @@ app.secret_key = os.environ.get('SECRET_KEY', 'dev_key_for_testing')  # Set a se
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    # The connection is per thread and persists across requests, only reset its state here
+    release_db(exception)
+    release_table_versions(exception)
+
+metrics.init_app(app)
+# Read the table versions once per request, for the query cache and the ETag
+app.before_request(snapshot_table_versions)
+
+@app.route('/metrics')
+def metrics_view():
+    """Request latency, SQL and render time histograms per endpoint, for Prometheus to scrape."""
+    response = make_response(metrics.render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+# --- Database CLI ---
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database, or upgrade an existing one to the latest schema."""
+    applied = migrate_db()
+    click.echo(f'Initialized the database (schema version {get_schema_version()}).')
+    for version, name in applied:
+        click.echo(f'  applied {version:04d}_{name}')
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = migrate_db()
+    if not applied:
+        click.echo(f'Database is up to date (schema version {get_schema_version()}).')
+    for version, name in applied:
+        click.echo(f'Applied {version:04d}_{name}')
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Fail if any hot query is not served by an index."""
+    failures = check_query_plans()
+    for name, plan in failures.items():
+        click.echo(f'{name}: ' + ' / '.join(plan), err=True)
+    if failures:
+        raise click.ClickException(f'{len(failures)} query plan(s) without an index.')
+    click.echo('All query plans use indexes.')
+
+@app.cli.command('worker')
+def worker_command():
+    """Deliver queued notifications from the outbox until interrupted."""
+    click.echo('Delivering notifications from the outbox (Ctrl+C to stop).')
+    notifications.run_outbox_worker()
+
+@app.cli.command('rebuild-activity')
+def rebuild_activity_command():
+    """Recompute the daily_activity rollup used by the activity graph."""
+    days = rebuild_daily_activity()
+    click.echo(f'Rebuilt activity for {days} day(s).')
+
+def get_build_token():
+    """
+    Hash of the code, templates and static files, so a deploy changes every ETag even when
+    the data did not. Content rather than start time keeps it the same across worker processes.
+    """
+    digest = hashlib.sha1()
+    patterns = ('*.py', 'templates/**/*', 'static/**/*')
+    paths = sorted({path for pattern in patterns for path in glob.glob(os.path.join(app.root_path, pattern), recursive=True)})
+    for path in paths:
+        if os.path.isfile(path):
+            digest.update(os.path.relpath(path, app.root_path).encode('utf-8'))
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+BUILD_TOKEN = get_build_token()
+
+def conditional(view):
+    """
+    Answer GETs with a weak ETag built from the build token, the data version and today's date, and reply
+    304 Not Modified to a matching If-None-Match before the view touches the database or templates.
+    Skipped while flash messages are pending, since the page would render (and consume) them.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('_flashes'):
+            return view(*args, **kwargs)
+        etag = f'{BUILD_TOKEN}-{get_data_version()}-{get_db_date()}'
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'  # Always revalidate
+        return response
+    return wrapper
 
 @app.route('/')
 def index():
     today = date.today()
-    tasks = get_tasks()
-    activity_data = get_activity_data()
+    tasks = get_tasks(limit=TASK_PAGE_SIZE)
+    # Same day as the loop below, even if the date rolls over during the request
+    activity_data = get_activity_data(today=today)
     
     # Get the last 21 days as a list for display
     last_21_days = []
@@ -28,12 +125,13 @@ def index():
         day_str = day.strftime('%Y-%m-%d')
         # Format the date for display
         day_display = day.strftime('%d/%m')
+        day_activity = activity_data[day_str]
         # Create activity info
         day_info = {
             'date': day_str,
             'display': day_display,
-            'actions': activity_data.get(day_str, {'actions': 0, 'completions': 0})['actions'],
-            'completions': activity_data.get(day_str, {'actions': 0, 'completions': 0})['completions'],
+            'actions': day_activity['actions'],
+            'completions': day_activity['completions'],
             'weekday': day.strftime('%a')[:1],  # First letter of weekday
             'is_today': day == today
         }
@@ -51,19 +149,55 @@ def index():
         random_thing['completion_date_display'] = get_display_date(random_thing['completion_date'], short=True)
 
     return render_template('index.html', tasks=tasks, today=today, activity_data=last_21_days, 
-                           current_goal=current_goal, priority_task=priority_task, random_thing=random_thing)
+                           current_goal=current_goal, priority_task=priority_task, random_thing=random_thing,
+                           next_cursor=get_task_cursor(tasks, TASK_PAGE_SIZE))
 
 
 # --- HTMX Routes ---
 
 def make_task_list():
     """Endpoint to fetch the task list partial for HTMX updates."""
-    tasks = get_tasks()
+    tasks = get_tasks(limit=TASK_PAGE_SIZE)
     current_goal = get_current_goal()
-    response = make_response(render_template('_tasks.html', tasks=tasks, current_goal=current_goal))
+    response = make_response(render_template('_tasks.html', tasks=tasks, current_goal=current_goal,
+                                             next_cursor=get_task_cursor(tasks, TASK_PAGE_SIZE)))
     response.headers['HX-Trigger'] = 'showFlash'
     return response
 
+def make_task_delta(task_id, moved=True, trigger='showFlash'):
+    """
+    Respond with out-of-band swaps for a single task instead of re-rendering the whole list.
+    The card is removed if the task left the list, replaced in place if its position is unchanged
+    (moved=False), and otherwise re-inserted before the task that now follows it.
+    Falls back to make_task_list() while the list has fewer than two tasks, so the empty state is handled.
+    """
+    if len(get_tasks(limit=2)) < 2:
+        response = make_task_list()
+        response.headers['HX-Trigger'] = trigger
+        return response
+
+    task = get_task_list_item(task_id)
+    next_id = get_next_task_id(task) if task and moved else None
+    response = make_response(render_template('_task_delta.html', task_id=task_id, task=task,
+                                             remove=moved or task is None, replace=not moved, next_id=next_id,
+                                             current_goal=get_current_goal()))
+    response.headers['HX-Reswap'] = 'none'  # Only the out-of-band swaps apply
+    response.headers['HX-Trigger'] = trigger
+    return response
+
+@app.route('/tasks')
+@conditional
+def more_tasks():
+    """Return the next page of task cards after the (after_date, after_id) cursor, for lazy loading."""
+    after_date = request.args.get('after_date')
+    after_id = request.args.get('after_id', type=int)
+    if not after_date or after_id is None:
+        return '', 400
+    tasks = get_tasks(limit=TASK_PAGE_SIZE, after=(after_date, after_id))
+    current_goal = get_current_goal()
+    return render_template('_task_items.html', tasks=tasks, current_goal=current_goal,
+                           next_cursor=get_task_cursor(tasks, TASK_PAGE_SIZE))
+
 @app.route('/add', methods=['POST'])
 def add_task():
     description = request.form['description']
@@ -82,44 +216,77 @@ def add_task():
         if current_goal:
             goal_id = current_goal['id']
     
-    insert_task(description, due_date_obj, goal_id)
+    task_id = insert_task(description, due_date_obj, goal_id)
     flash('Task added successfully!', 'success')
 
-    # Return the updated task list partial for HTMX
-    return make_task_list()
+    # Return just the new task card for HTMX
+    return make_task_delta(task_id)
 
 
 
 @app.route('/toggle/<int:task_id>', methods=['POST'])
 def toggle_task(task_id):
-    task = get_task(task_id)
+    with transaction():
+        task = get_task(task_id)
+        if task:
+            new_status = not task['completed']
+            today = date.today()
+
+            if new_status:  # If task is being marked as completed
+                update_task(task_id, {'completed': new_status, 'completion_date': get_db_date(today)})
+            else:  # If task is being marked as pending
+                update_task(task_id, {'completed': new_status, 'completion_date': None})
+
     if task:
-        new_status = not task['completed']
-        today = date.today()
-        
-        if new_status:  # If task is being marked as completed
-            update_task(task_id, {'completed': new_status, 'completion_date': get_db_date(today)})
-        else:  # If task is being marked as pending
-            update_task(task_id, {'completed': new_status, 'completion_date': None})
-        
         status_text = "completed" if new_status else "marked as pending"
         flash(f'Task {status_text}.', 'success')
     else:
         flash('Task not found.', 'error')
+        return make_task_list()
 
-    # Get the updated list of tasks and priority task for the response
-    tasks = get_tasks()
-    current_goal = get_current_goal()
     priority_task = get_priority_task()
     
-    # Create response with both task list and HX-Trigger for goal refresh
-    response = make_response(render_template('_tasks.html', tasks=tasks, current_goal=current_goal))
-    response.headers['HX-Trigger'] = json.dumps({
+    # Swap just the toggled task card, with HX-Trigger for goal refresh
+    return make_task_delta(task_id, moved=False, trigger=json.dumps({
         'showFlash': True,
         'refreshGoalSection': {'priority_task': priority_task is not None},
         'refreshPriorityTask': True
+    }))
+
+
+BULK_MESSAGES = {
+    'complete': 'completed',
+    'snooze': 'snoozed',
+    'reset_date': 'reset to today',
+    'give_up': 'given up',
+    'priority': 'updated',
+}
+
+@app.route('/tasks/bulk', methods=['POST'])
+def bulk_tasks():
+    """Apply one operation to all selected tasks in a single transaction, and re-render the list once."""
+    task_ids = request.form.getlist('task_ids', type=int)
+    operation = request.form.get('operation')
+    if not task_ids:
+        flash('No tasks selected.', 'error')
+        return make_task_list()
+
+    try:
+        changed = bulk_update_tasks(task_ids, operation,
+                                    days=request.form.get('days', type=int),
+                                    priority=request.form.get('priority', type=int),
+                                    action_description=request.form.get('action_description', '').strip() or None)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return make_task_list()
+
+    flash(f"{len(changed)} task{'s' if len(changed) != 1 else ''} {BULK_MESSAGES[operation]}.", 'success')
+    response = make_task_list()
+    response.headers['HX-Trigger'] = json.dumps({
+        'showFlash': True,
+        'refreshGoalSection': {'priority_task': get_priority_task() is not None},
+        'refreshPriorityTask': True
     })
-    
     return response
 
 
@@ -128,13 +295,13 @@ def remove_task(task_id):
     give_up_task(task_id)
     flash('Task given up.', 'info')
 
-    # Return the updated task list partial for HTMX
-    return make_task_list()
+    # Remove just this task card
+    return make_task_delta(task_id)
 
 
 @app.route('/notify/<int:task_id>', methods=['POST'])
 def notify_task(task_id):
-    """Send a notification about the task to ntfy."""
+    """Queue a notification about the task; the outbox worker delivers it in the background."""
     task = get_task(task_id)
     
     if not task:
@@ -142,16 +309,13 @@ def notify_task(task_id):
         return '', 400  # Bad request
     
     try:
-        status_code = notifications.send_notification(task)  # Use the module reference
-        if status_code == 200:
-            flash('Notification sent successfully!', 'success')
-        elif isinstance(status_code, str):
-            flash(f'Failed to send notification. {status_code}', 'error')
+        if notifications.queue_notification(task):
+            notifications.wake_outbox_worker()
+            flash('Notification queued.', 'success')
         else:
-            flash(f'Failed to send notification. Status code: {status_code}', 'error')
-            
+            flash('Notification already sent or queued.', 'info')
     except Exception as e:
-        flash(f'Error sending notification: {str(e)}', 'error')
+        flash(f'Error queuing notification: {str(e)}', 'error')
     
     # Return a response with HX-Trigger to show flash messages
     return make_task_list()
@@ -160,6 +324,7 @@ def notify_task(task_id):
 # --- Task History Routes ---
 
 @app.route('/task/<int:task_id>')
+@conditional
 def task_history(task_id):
     """Show task history page with all actions for a specific task."""
     task = get_task(task_id)
@@ -207,6 +372,7 @@ def get_edit_next_action_form(task_id):
 
 
 @app.route('/task/<int:task_id>/view_next_action', methods=['GET'])
+@conditional
 def get_view_next_action(task_id):
     """Serve the partial template for viewing next_action."""
     task = get_task(task_id)
@@ -232,14 +398,14 @@ def add_task_action(task_id):
         flash('Task not found.', 'error')
         return '', 404
     
-    # Add the action
-    today = get_db_date()
-    insert_action(task_id, action_description, today)
-    
-    # Handle snoozing if action_snooze is provided
-    if action_snooze:
-        message, status = snooze_task(task_id, int(action_snooze))
-        flash(message, status)
+    # Add the action and snooze (if action_snooze is provided) in one commit
+    with transaction():
+        today = get_db_date()
+        insert_action(task_id, action_description, today)
+
+        if action_snooze:
+            message, status = snooze_task(task_id, int(action_snooze))
+            flash(message, status)
 
     actions = get_actions(task_id)
     
@@ -258,7 +424,7 @@ def add_task_action(task_id):
 def snooze_modal(task_id, days):
     """Show a modal dialog to enter action before snoozing a task."""
     # Validate days input
-    if days not in [1, 3, 7, 30]:
+    if days not in SNOOZE_DAYS:
         flash('Invalid snooze duration.', 'error')
         return '', 400
     
@@ -287,18 +453,24 @@ def snooze_task(task_id, days):
     task = get_task(task_id)
 
     if task:
-        message, status = snooze_task(task_id, days)
-        flash(message, status)
+        # The new due date, next action and action entry are committed together
+        with transaction():
+            message, status = snooze_task(task_id, days)
+            flash(message, status)
+
+            if status == 'success':
+                # Update next action if provided
+                if next_action_text:
+                    update_task(task_id, {'next_action': next_action_text})
+
+                # Add an action entry for the snooze
+                today = get_db_date()
+                insert_action(task_id, action_description, today)
+                flash('Action added successfully.', 'success')
 
         if status == 'success':
-            # Update next action if provided
-            if next_action_text:
-                update_task(task_id, {'next_action': next_action_text})
-
-            # Add an action entry for the snooze
-            today = get_db_date()        
-            insert_action(task_id, action_description, today)
-            flash('Action added successfully.', 'success')
+            # Move just this task card to its new position
+            return make_task_delta(task_id)
         
     else:
         flash('Task not found.', 'error')
@@ -308,7 +480,7 @@ def snooze_task(task_id, days):
 
 def snooze_task(task_id, days):
     task = get_task(task_id)
-    if days not in [1, 3, 7, 30]:
+    if days not in SNOOZE_DAYS:
         return False, 'Invalid snooze duration.'
     current_due_date = date.today()
     if task['due_date']:
@@ -364,15 +536,16 @@ def reset_date(task_id):
         # Check if task is overdue
         today = date.today()
         
-        # Update the task with today's date
+        # Update the task with today's date and add an action entry, in one commit
         today_db_format = get_db_date(today)
-        update_task(task_id, {'due_date': today_db_format})
-        
-        # Add an action entry for resetting the date
-        insert_action(task_id, "Reset due date to today", today)
+        with transaction():
+            update_task(task_id, {'due_date': today_db_format})
+            insert_action(task_id, "Reset due date to today", today)
         
         formatted_date = format_date(today)
         flash(f'Due date for task reset to today ({formatted_date}).', 'success')
+        # Move just this task card to its new position
+        return make_task_delta(task_id, moved=task['due_date'] != today_db_format)
     else:
         flash('Task not found.', 'error')
 
@@ -386,12 +559,14 @@ def edit_goal():
     return render_template('_goal_edit.html', current_goal=current_goal)
 
 @app.route('/goal/view')
+@conditional
 def view_goal():
     current_goal = get_current_goal()
     priority_task = get_priority_task()
     return render_template('_goal_view.html', current_goal=current_goal, priority_task=priority_task)
 
 @app.route('/priority-task')
+@conditional
 def get_priority_task_container():
     """Return the priority task container HTML for HTMX updates."""
     priority_task = get_priority_task()
@@ -455,12 +630,29 @@ def save_note():
     return redirect(url_for('view_notes'))
 
 @app.route('/notes/view')
+@conditional
 def view_notes():
-    """Route to view all notes."""
-    notes = get_notes()    
-    return render_template('notes_list.html', notes=notes)
+    """Route to view notes, one page at a time (optionally filtered by ?type=)."""
+    note_type = request.args.get('type') or None
+    notes = get_notes(limit=NOTE_PAGE_SIZE, note_type=note_type)
+    return render_template('notes_list.html', notes=notes, note_type=note_type,
+                           next_cursor=get_note_cursor(notes, NOTE_PAGE_SIZE))
+
+@app.route('/notes/page')
+@conditional
+def more_notes():
+    """Return the next page of notes after the (after_date, after_id) cursor, for infinite scroll."""
+    after_date = request.args.get('after_date')
+    after_id = request.args.get('after_id', type=int)
+    if not after_date or after_id is None:
+        return '', 400
+    note_type = request.args.get('type') or None
+    notes = get_notes(limit=NOTE_PAGE_SIZE, after=(after_date, after_id), note_type=note_type)
+    return render_template('_note_items.html', notes=notes, note_type=note_type,
+                           next_cursor=get_note_cursor(notes, NOTE_PAGE_SIZE))
 
 @app.route('/notes/<int:note_id>')
+@conditional
 def view_note(note_id):
     """Route to view a specific note."""
     note = get_note(note_id)
@@ -581,6 +773,7 @@ def save_random_thing():
     return redirect(url_for('view_random_things'))
 
 @app.route('/random/view')
+@conditional
 def view_random_things():
     """Route to view all random things to do."""
     random_things = get_random_things()
@@ -644,7 +837,18 @@ def delete_random_thing_route(thing_id):
     return redirect(url_for('view_random_things'))
 
 
+@app.route('/search')
+def search_view():
+    """Full-text search over tasks, actions and notes; HTMX requests get just the results partial."""
+    query = request.args.get('q', '').strip()
+    results = search(query) if query else []
+    if request.headers.get('HX-Request'):
+        return render_template('_search_results.html', query=query, results=results)
+    return render_template('search.html', query=query, results=results)
+
+
 @app.route('/tasks/given-up')
+@conditional
 def view_given_up_tasks():
     """Show a page listing all tasks marked as given up."""
     given_up_tasks = get_tasks(given_up=True)
@@ -652,6 +856,7 @@ def view_given_up_tasks():
 
 
 @app.route('/goals')
+@conditional
 def view_goals():
     db = get_db()
     cur = db.execute('SELECT id, description, created_date, target_date, completed, completion_date FROM goals ORDER BY created_date DESC')
@@ -661,12 +866,14 @@ def view_goals():
 # --- Habits Routes ---
 
 @app.route('/habits')
+@conditional
 def view_habits():
     """Route to view all habits."""
     habits = get_habits()
     return render_template('habits_list.html', habits=habits)
 
 @app.route('/habits/<int:habit_id>')
+@conditional
 def view_habit(habit_id):
     """Route to view a specific habit and its tasks."""
     habit = get_habit(habit_id)
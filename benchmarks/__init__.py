@@ -0,0 +1,9 @@
+"""
+Benchmarks for Melga on synthetic data.
+
+    python -m benchmarks generate bench.db --tasks 100000 --actions 300000 --notes 20000
+    python -m benchmarks run bench.db --output results.json
+    python -m benchmarks compare baseline.json results.json
+
+See benchmarks/__main__.py for all options.
+"""
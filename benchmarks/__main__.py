@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+import db
+from benchmarks import datagen, micro, routes, stats
+
+
+def generate_command(args):
+    counts = {name: getattr(args, name) for name in datagen.DEFAULT_COUNTS if getattr(args, name) is not None}
+    counts = datagen.generate(args.database, counts, seed=args.seed)
+    print(f'Generated {args.database}: ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+
+
+def run_command(args):
+    # Benchmarks write to the database, so they run on a throwaway copy
+    workdir = tempfile.mkdtemp(prefix='melga-bench-')
+    copy = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(args.database, copy)
+    db.close_db()
+    db.DATABASE = copy
+    try:
+        # Databases generated by an older checkout are brought up to the current schema
+        db.migrate_db()
+        results = {}
+        if args.suite in ('all', 'db'):
+            results.update(micro.run(args.iterations, warm_cache=args.warm_cache, seed=args.seed))
+        if args.suite in ('all', 'routes'):
+            results.update(routes.run(args.route_iterations, seed=args.seed))
+    finally:
+        db.close_db()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        'metadata': {
+            'database': os.path.abspath(args.database),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'route_iterations': args.route_iterations,
+            'warm_cache': args.warm_cache,
+        },
+        'results': results,
+    }
+    print(f'{"benchmark":<40} {"p50 ms":>10} {"p95 ms":>10} {"p99 ms":>10}')
+    for name, result in results.items():
+        print(f'{name:<40} {result["p50"]:>10.3f} {result["p95"]:>10.3f} {result["p99"]:>10.3f}')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(document, output, indent=2)
+        print(f'Results written to {args.output}')
+
+
+def compare_command(args):
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        baseline, current = json.load(baseline_file), json.load(current_file)
+    rows = stats.compare(baseline, current, threshold=args.threshold, metric=args.metric)
+    print(f'{"benchmark":<40} {"baseline":>10} {"current":>10} {"ratio":>8}')
+    for name, before, after, ratio, regressed in rows:
+        print(f'{name:<40} {before:>10.3f} {after:>10.3f} {ratio:>8.2f}' + ('  REGRESSION' if regressed else ''))
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f'{len(regressions)} regression(s) above {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+    print('No regressions')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Melga performance benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='create a synthetic database')
+    generate.add_argument('database')
+    generate.add_argument('--seed', type=int, default=42)
+    for name, default in datagen.DEFAULT_COUNTS.items():
+        generate.add_argument(f'--{name.replace("_", "-")}', dest=name, type=int, help=f'default {default}')
+    generate.set_defaults(func=generate_command)
+
+    run = commands.add_parser('run', help='benchmark db.py and routes against a database')
+    run.add_argument('database')
+    run.add_argument('--output', '-o')
+    run.add_argument('--suite', choices=['all', 'db', 'routes'], default='all')
+    run.add_argument('--iterations', type=int, default=50)
+    run.add_argument('--route-iterations', type=int, default=30)
+    run.add_argument('--warm-cache', action='store_true', help='keep the query cache between iterations')
+    run.add_argument('--seed', type=int, default=42)
+    run.set_defaults(func=run_command)
+
+    compare = commands.add_parser('compare', help='compare two result files and fail on regressions')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown as a fraction (default 0.2)')
+    compare.add_argument('--metric', choices=['p50', 'p95', 'p99', 'mean'], default='p50')
+    compare.set_defaults(func=compare_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Deterministic synthetic data generator for benchmarks."""
+import random
+from datetime import date, timedelta
+
+import db
+
+BATCH_SIZE = 10000
+
+DEFAULT_COUNTS = {
+    'tasks': 10000,
+    'actions': 30000,
+    'notes': 2000,
+    'habits': 50,
+    'goals': 200,
+    'random_things': 500,
+}
+
+WORDS = (
+    'call email plan review write fix buy book clean pay read prepare send check update '
+    'plumber dentist report budget garden car taxes invoice meeting project kitchen doctor '
+    'insurance presentation groceries birthday travel bank school library gym bike'
+).split()
+
+NOTE_TYPES = ['general', 'task', 'goal', 'idea', 'til']
+PERIODICITIES = list(db.PERIODICITY_DAYS)
+
+
+def _sentence(rng, min_words, max_words):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize()
+
+
+def _day(today, days_ago):
+    return db.get_db_date(today - timedelta(days=days_ago))
+
+
+def _insert_batches(conn, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate(path, counts=None, seed=42, history_days=3650, today=None):
+    """
+    Create (or extend) a database at path with synthetic data.
+    The same seed, counts and today always produce the same rows.
+    Most tasks are completed in the past, like a long-lived real database; a few hundred are open.
+    Returns the counts used.
+    """
+    counts = {**DEFAULT_COUNTS, **(counts or {})}
+    today = today or date.today()
+    rng = random.Random(seed)
+
+    conn = db.connect(path)
+    db.migrate_db(conn)
+    # Bulk load speed over durability; the file is disposable
+    conn.execute('PRAGMA synchronous = OFF')
+
+    with conn:
+        _insert_batches(conn, 'INSERT INTO goals (description, created_date, target_date, completed, completion_date) VALUES (?, ?, ?, ?, ?)', (
+            (_sentence(rng, 2, 6), _day(today, age), _day(today, age - 30), int(age > 30), _day(today, age - rng.randint(0, 30)) if age > 30 else None)
+            for age in (rng.randint(0, history_days) for _ in range(counts['goals']))
+        ))
+        _insert_batches(conn, 'INSERT INTO habits (description, created_date, periodicity) VALUES (?, ?, ?)', (
+            (_sentence(rng, 2, 4), _day(today, rng.randint(0, history_days)), rng.choice(PERIODICITIES))
+            for _ in range(counts['habits'])
+        ))
+
+        def tasks():
+            open_tasks = min(counts['tasks'], max(counts['tasks'] // 100, 50))
+            for i in range(counts['tasks']):
+                age = rng.randint(0, history_days)
+                due_days_ago = age - rng.randint(0, 30)
+                is_open = i >= counts['tasks'] - open_tasks
+                completed = 0 if is_open else 1
+                completion_date = None if is_open else _day(today, max(due_days_ago - rng.randint(-5, 5), 1))
+                yield (
+                    _sentence(rng, 2, 8),
+                    _day(today, due_days_ago if not is_open else rng.randint(-30, 30)),
+                    completed,
+                    completion_date,
+                    _sentence(rng, 2, 10) if rng.random() < 0.5 else None,
+                    rng.randint(1, counts['goals']) if counts['goals'] and rng.random() < 0.2 else None,
+                    1 if rng.random() < 0.05 else 0,
+                    1 if rng.random() < 0.03 else 0,
+                    _day(today, age),
+                    rng.randint(1, counts['habits']) if counts['habits'] and rng.random() < 0.1 else None,
+                )
+        _insert_batches(conn, 'INSERT INTO tasks (description, due_date, completed, completion_date, next_action, goal_id, priority, give_up, created_date, habit_id) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', tasks())
+
+        _insert_batches(conn, 'INSERT INTO task_actions (task_id, action_description, action_date) VALUES (?, ?, ?)', (
+            (rng.randint(1, counts['tasks']), _sentence(rng, 3, 12), _day(today, rng.randint(0, history_days)))
+            for _ in range(counts['actions'] if counts['tasks'] else 0)
+        ))
+        _insert_batches(conn, 'INSERT INTO notes (title, note, type, created_date) VALUES (?, ?, ?, ?)', (
+            (_sentence(rng, 2, 6), '\n'.join(_sentence(rng, 5, 20) for _ in range(rng.randint(1, 40))),
+             rng.choice(NOTE_TYPES), _day(today, rng.randint(0, history_days)))
+            for _ in range(counts['notes'])
+        ))
+        _insert_batches(conn, 'INSERT INTO random_things_to_do (description, completed, completion_date, link) VALUES (?, ?, ?, ?)', (
+            (_sentence(rng, 2, 6), int(done), _day(today, rng.randint(0, history_days)) if done else None, None)
+            for done in (rng.random() < 0.3 for _ in range(counts['random_things']))
+        ))
+
+    conn.execute('ANALYZE')
+    conn.close()
+    return counts
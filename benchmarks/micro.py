@@ -0,0 +1,120 @@
+"""Microbenchmarks for the public functions in db.py."""
+import itertools
+import random
+from datetime import date
+
+import db
+from benchmarks.stats import measure
+
+
+def _ids(conn, table, where='1 = 1'):
+    return [row[0] for row in conn.execute(f'SELECT id FROM {table} WHERE {where} ORDER BY id')]
+
+
+def run(iterations=50, warm_cache=False, seed=42):
+    """
+    Benchmark every public db.py function against the current database (db.DATABASE).
+    Read functions run with a cleared query cache unless warm_cache is set.
+    Write functions modify the database, so run this on a disposable copy.
+    Returns a dict of benchmark name -> summary.
+    """
+    rng = random.Random(seed)
+    conn = db.get_db()
+    task_ids = _ids(conn, 'tasks')
+    open_task_ids = _ids(conn, 'tasks', 'completed = 0 AND give_up = 0') or task_ids
+    action_ids = _ids(conn, 'task_actions')
+    note_ids = _ids(conn, 'notes')
+    goal_ids = _ids(conn, 'goals')
+    habit_ids = _ids(conn, 'habits')
+    thing_ids = _ids(conn, 'random_things_to_do')
+    today = date.today()
+    first_page = db.get_tasks(limit=db.TASK_PAGE_SIZE)
+    first_notes = db.get_notes(limit=db.NOTE_PAGE_SIZE)
+
+    def pick(ids):
+        return lambda: (rng.choice(ids),)
+
+    def cold(func):
+        if warm_cache:
+            return func
+        def wrapper(*args):
+            db.query_cache.clear()
+            return func(*args)
+        return wrapper
+
+    counter = itertools.count(1)
+    reads = {
+        'get_task': (db.get_task, pick(task_ids)),
+        'get_overdue_tasks': (db.get_overdue_tasks, None),
+        'get_activity_data[21]': (db.get_activity_data, lambda: (21,)),
+        'get_activity_data[365]': (db.get_activity_data, lambda: (365,)),
+        'get_current_goal': (db.get_current_goal, None),
+        'get_tasks[page]': (db.get_tasks, lambda: (False, db.TASK_PAGE_SIZE)),
+        'get_tasks[next_page]': (db.get_tasks, lambda: (False, db.TASK_PAGE_SIZE, db.get_task_cursor(first_page, db.TASK_PAGE_SIZE))),
+        'get_tasks[all]': (db.get_tasks, None),
+        'get_tasks[given_up]': (db.get_tasks, lambda: (True,)),
+        'get_task_list_item': (db.get_task_list_item, pick(open_task_ids)),
+        'get_next_task_id': (db.get_next_task_id, lambda: (rng.choice(first_page),) if first_page else ({'due_date': db.get_db_date(today), 'id': 0},)),
+        'get_priority_task': (db.get_priority_task, None),
+        'get_actions': (db.get_actions, pick(task_ids)),
+        'get_action': (db.get_action, pick(action_ids)),
+        'get_note': (db.get_note, pick(note_ids)),
+        'get_notes[page]': (db.get_notes, lambda: (db.NOTE_PAGE_SIZE,)),
+        'get_notes[next_page]': (db.get_notes, lambda: (db.NOTE_PAGE_SIZE, db.get_note_cursor(first_notes, db.NOTE_PAGE_SIZE))),
+        'get_notes[type]': (db.get_notes, lambda: (db.NOTE_PAGE_SIZE, None, 'idea')),
+        'search': (db.search, lambda: (rng.choice(['plumb', 'budget report', 'ca', 'meeting doctor']),)),
+        'get_random_thing': (db.get_random_thing, None),
+        'get_random_thing[incomplete]': (lambda: db.get_random_thing(only_incomplete=True), None),
+        'get_random_things': (db.get_random_things, None),
+        'get_calendar_events': (db.get_calendar_events, lambda: (rng.sample(task_ids, min(50, len(task_ids))),)),
+        'get_stale_calendar_events': (db.get_stale_calendar_events, None),
+        'get_habits': (db.get_habits, None),
+        'get_habit': (db.get_habit, pick(habit_ids)),
+        'get_tasks_by_habit': (db.get_tasks_by_habit, pick(habit_ids)),
+        'get_habit_states': (db.get_habit_states, None),
+        'get_habits_without_tasks': (db.get_habits_without_tasks, None),
+        'calculate_habit_due_dates': (db.calculate_habit_due_dates, lambda: ([{'last_completion_date': '2001-01-01', 'periodicity': 'weekly'}] * 1000,)),
+        'get_data_version': (db.get_data_version, None),
+        'check_query_plans': (db.check_query_plans, None),
+    }
+    writes = {
+        'set_last_notification': (db.set_last_notification, lambda: ({'id': rng.choice(task_ids)},)),
+        'set_last_notifications': (db.set_last_notifications, lambda: (rng.sample(task_ids, min(50, len(task_ids))),)),
+        'insert_action': (db.insert_action, lambda: (rng.choice(task_ids), 'Benchmark action', today)),
+        'give_up_task': (db.give_up_task, pick(open_task_ids)),
+        'update_task': (db.update_task, lambda: (rng.choice(task_ids), {'next_action': f'Next {next(counter)}', 'priority': 0})),
+        'update_note': (db.update_note, lambda: (rng.choice(note_ids), {'title': f'Title {next(counter)}'})),
+        'update_goal': (db.update_goal, lambda: (rng.choice(goal_ids), {'description': f'Goal {next(counter)}'})),
+        'update_many': (db.update_many, lambda: ('tasks', [(task_id, {'priority': 0}) for task_id in rng.sample(task_ids, min(50, len(task_ids)))])),
+        'insert_goal': (db.insert_goal, lambda: ('Benchmark goal', today, today)),
+        'insert_note': (db.insert_note, lambda: ('Benchmark note', 'Body ' * 50, 'general', today)),
+        'insert_task': (db.insert_task, lambda: ('Benchmark task', today)),
+        'insert_tasks': (db.insert_tasks, lambda: ([{'description': 'Benchmark task', 'due_date': today}] * 50,)),
+        'insert_random_thing': (db.insert_random_thing, lambda: ('Benchmark thing',)),
+        'toggle_random_thing': (db.toggle_random_thing, pick(thing_ids)),
+        'insert_habit': (db.insert_habit, lambda: ('Benchmark habit', today, 'weekly')),
+        'save_calendar_events': (db.save_calendar_events, lambda: ([(rng.choice(task_ids), '13:00', 'bench', today)],)),
+        'delete_calendar_events': (db.delete_calendar_events, lambda: ([(rng.choice(task_ids), '13:00')],)),
+        # Deletes remove rows created by the insert benchmarks above
+        'delete_task': (db.delete_task, lambda: (db.insert_task('Benchmark task', today),)),
+        'delete_action': (db.delete_action, lambda: (_last_id(conn, 'task_actions', lambda: db.insert_action(rng.choice(task_ids), 'Benchmark action', today)),)),
+        'delete_note': (db.delete_note, lambda: (_last_id(conn, 'notes', lambda: db.insert_note('Benchmark note', 'Body', 'general', today)),)),
+        'delete_random_thing': (db.delete_random_thing, lambda: (_last_id(conn, 'random_things_to_do', lambda: db.insert_random_thing('Benchmark thing')),)),
+    }
+    heavy = {
+        'rebuild_daily_activity': (db.rebuild_daily_activity, None),
+    }
+
+    results = {}
+    for name, (func, setup) in reads.items():
+        results[f'db.{name}'] = measure(cold(func), iterations, setup)
+    for name, (func, setup) in writes.items():
+        results[f'db.{name}'] = measure(func, iterations, setup)
+    for name, (func, setup) in heavy.items():
+        results[f'db.{name}'] = measure(func, max(3, iterations // 10), setup)
+    return results
+
+
+def _last_id(conn, table, insert):
+    insert()
+    return conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0]
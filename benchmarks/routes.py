@@ -0,0 +1,36 @@
+"""Route-level benchmarks through the Flask test client."""
+import random
+
+import db
+from benchmarks.stats import measure
+
+
+def run(iterations=30, seed=42):
+    """
+    Benchmark the main pages and a task toggle against the current database (db.DATABASE).
+    The query cache is cleared before every request, so each one pays for its SQL.
+    Returns a dict of benchmark name -> summary.
+    """
+    from app import app
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    conn = db.get_db()
+    open_task_ids = [row[0] for row in conn.execute('SELECT id FROM tasks WHERE completed = 0 AND give_up = 0')]
+    task_ids = [row[0] for row in conn.execute('SELECT id FROM tasks ORDER BY id DESC LIMIT 1000')]
+
+    def request(method, url):
+        db.query_cache.clear()
+        response = client.open(url, method=method)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}')
+
+    routes = {
+        'GET /': lambda: ('GET', '/'),
+        'POST /toggle/<id>': lambda: ('POST', f'/toggle/{rng.choice(open_task_ids)}'),
+        'GET /task/<id>': lambda: ('GET', f'/task/{rng.choice(task_ids)}'),
+        'GET /notes/view': lambda: ('GET', '/notes/view'),
+        'GET /habits': lambda: ('GET', '/habits'),
+        'GET /search': lambda: ('GET', '/search?q=budget'),
+    }
+    return {f'route.{name}': measure(request, iterations, setup) for name, setup in routes.items()}
@@ -0,0 +1,60 @@
+"""Timing, percentile summaries and baseline comparison for benchmark results."""
+import time
+
+# Regressions smaller than this many milliseconds are treated as noise
+NOISE_FLOOR_MS = 0.05
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(durations_ms):
+    values = sorted(durations_ms)
+    return {
+        'n': len(values),
+        'min': values[0],
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1],
+        'mean': sum(values) / len(values),
+    }
+
+
+def measure(func, iterations, setup=None, warmup=1):
+    """
+    Call func iterations times (after warmup calls) and summarize the durations in milliseconds.
+    setup, if given, is called before every call (untimed) and its return value is passed as func's arguments.
+    """
+    for _ in range(warmup):
+        func(*(setup() if setup else ()))
+    durations = []
+    for _ in range(iterations):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        durations.append((time.perf_counter() - start) * 1000)
+    return summarize(durations)
+
+
+def compare(baseline, current, threshold=0.2, metric='p50'):
+    """
+    Compare two result documents. A benchmark regresses when its metric grew by more than
+    threshold (a fraction) and by more than NOISE_FLOOR_MS.
+    Returns a list of (name, baseline value, current value, ratio, regressed) tuples.
+    """
+    rows = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        before, after = base[metric], result[metric]
+        ratio = after / before if before else float('inf')
+        regressed = ratio > 1 + threshold and after - before > NOISE_FLOOR_MS
+        rows.append((name, before, after, ratio, regressed))
+    return rows
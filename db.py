@@ -1,9 +1,30 @@
-from flask import g
+import atexit
+import contextlib
+import functools
+import html
+import json
 import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from datetime import date, timedelta, datetime
+import os
 import random
+import re
 
-DATABASE = 'tasks.db'
+DATABASE = os.environ.get('MELGA_DATABASE', 'tasks.db')
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Connection tuning, applied once per connection
+STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
+CONNECTION_PRAGMAS = (
+    ('journal_mode', 'WAL'),  # Readers don't block the writer (and vice versa) across gunicorn workers
+    ('synchronous', 'NORMAL'),  # Safe with WAL, avoids an fsync per commit
+    ('busy_timeout', 5000),  # Wait up to 5s for a competing writer instead of failing
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16000),  # Negative value is in KiB, i.e. ~16MB page cache
+)
 
 # Date format constants
 DATE_DB_FORMAT = '%Y-%m-%d'  # Format for storing dates in the database
@@ -20,56 +41,620 @@ def parse_date(date_str, format_str=DATE_DB_FORMAT):
     """Parse a date string into a date object."""
     if not date_str:
         return None
+    if format_str == DATE_DB_FORMAT:
+        return _parse_db_date(date_str)
     try:
         return datetime.strptime(date_str, format_str).date()
     except ValueError:
         return None
 
+@functools.lru_cache(maxsize=4096)
+def _parse_db_date(date_str):
+    # fromisoformat is much faster than strptime, and the same few thousand dates repeat across listings
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        return None
+
 def get_db_date(date_obj=None):
     """Convert a date object to database format string."""
     if date_obj is None:
         date_obj = date.today()
-    return format_date(date_obj, DATE_DB_FORMAT)
+    return date_obj.isoformat()
+
+@functools.lru_cache(maxsize=4096)
+def format_db_date(date_str, format_str, invalid=None):
+    """Reformat a database date string for display (memoized), or return invalid if it does not parse."""
+    date_obj = parse_date(date_str)
+    return format_date(date_obj, format_str) if date_obj else invalid
 
 def get_display_date(date_str, short=False):
     """Convert a database date string to display format."""
     if not date_str:
         return "Unknown Date"
-    
-    date_obj = parse_date(date_str)
-    if not date_obj:
-        return "Invalid Date"
-    
     format_str = DATE_DISPLAY_SHORT if short else DATE_DISPLAY_FORMAT
-    return format_date(date_obj, format_str)
+    return format_db_date(date_str, format_str, "Invalid Date")
 
-def get_db():
-    try:
-        db = getattr(g, '_database', None)
-        if db is None:
-            db = g._database = sqlite3.connect(DATABASE)
-    except RuntimeError:
-        db = sqlite3.connect(DATABASE)
+# --- Row Types ---
+
+class memoized:
+    """Like functools.cached_property, for classes with __slots__: the value is kept in the slot '_<name>'."""
+
+    def __init__(self, func):
+        self.func = func
+        self.slot = '_' + func.__name__
+        functools.update_wrapper(self, func)
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.func(obj)
+            setattr(obj, self.slot, value)
+            return value
+
+class Row:
+    """
+    Compact read-only query row, built straight from the cursor by Row.factory.
+    Columns are __slots__ listed in _fields (in SELECT order) and read as attributes; derived
+    values in _derived are memoized properties. Dict-style access (row['id'], row.get('id'),
+    dict(row)) keeps working for existing callers and templates.
+    Rows are shared through the query cache, so they must not be modified.
+    """
+    __slots__ = ()
+    _fields = ()
+    _derived = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def factory(cls, cursor, row):
+        return cls(*row)
+
+    def keys(self):
+        return self._fields + self._derived
+
+    def __getitem__(self, key):
+        if key in self._fields or key in self._derived:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._fields or key in self._derived
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{type(self).__name__}({values})'
+
+def fetch_rows(row_type, sql, params=()):
+    """Run a query and return its rows as row_type instances (see Row)."""
+    cursor = get_db().cursor()
+    cursor.row_factory = row_type.factory
+    return cursor.execute(sql, params).fetchall()
+
+def fetch_row(row_type, sql, params=()):
+    rows = fetch_rows(row_type, sql, params)
+    return rows[0] if rows else None
+
+class Task(Row):
+    """A tasks row as shown in the task list."""
+    _fields = ('id', 'description', 'due_date', 'completed', 'goal_id', 'completion_date',
+               'next_action', 'priority', 'last_notification')
+    _derived = ('due_date_display', 'is_overdue')
+    __slots__ = _fields + ('_due', '_due_date_display', '_is_overdue')
+
+    @memoized
+    def due(self):
+        return parse_date(self.due_date)
+
+    @memoized
+    def due_date_display(self):
+        return format_db_date(self.due_date, '%d/%b', "Invalid Date")
+
+    @memoized
+    def is_overdue(self):
+        return bool(self.due and not self.completed and self.due < date.today())
+
+class TaskDetail(Task):
+    """A tasks row for the task page, with the full due date."""
+    __slots__ = ()
+
+    @memoized
+    def due_date_display(self):
+        return format_db_date(self.due_date, DATE_DISPLAY_FORMAT)
+
+TASK_COLUMNS = ', '.join(Task._fields)
+
+class Action(Row):
+    _fields = ('id', 'action_description', 'action_date')
+    _derived = ('action_date_display',)
+    __slots__ = _fields + ('_action_date_display',)
+
+    @memoized
+    def action_date_display(self):
+        return get_display_date(self.action_date)
+
+class NoteSummary(Row):
+    """A notes row with a preview of the body (see get_notes)."""
+    _fields = ('id', 'title', 'note', 'has_more', 'type', 'created_date')
+    _derived = ('created_date_display',)
+    __slots__ = _fields + ('_created_date_display',)
+
+    @memoized
+    def created_date_display(self):
+        return get_display_date(self.created_date, short=True)
+
+class RandomThing(Row):
+    _fields = ('id', 'description', 'completed', 'completion_date', 'link')
+    _derived = ('completion_date_display',)
+    __slots__ = _fields + ('_completion_date_display',)
+
+    @memoized
+    def completion_date_display(self):
+        if not self.completion_date:
+            return None
+        return get_display_date(self.completion_date, short=True)
+
+# --- Connection Management ---
+
+_local = threading.local()
+_connections = weakref.WeakSet()  # Open connections of live threads, for close_all_connections()
+_connections_lock = threading.Lock()
+
+class QueryStats:
+    """Number of statements run and time spent in SQLite by one thread since the last reset."""
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+def get_query_stats():
+    stats = getattr(_local, 'query_stats', None)
+    if stats is None:
+        stats = _local.query_stats = QueryStats()
+    return stats
+
+def reset_query_stats():
+    """Start counting from zero for this thread (called at the start of every request)."""
+    _local.query_stats = QueryStats()
+    return _local.query_stats
+
+def _timed(method, counts_query):
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            stats = get_query_stats()
+            stats.seconds += time.perf_counter() - start
+            stats.queries += counts_query
+    return wrapper
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds its statements and fetches to this thread's QueryStats."""
+    execute = _timed(sqlite3.Cursor.execute, 1)
+    executemany = _timed(sqlite3.Cursor.executemany, 1)
+    executescript = _timed(sqlite3.Cursor.executescript, 1)
+    fetchone = _timed(sqlite3.Cursor.fetchone, 0)
+    fetchmany = _timed(sqlite3.Cursor.fetchmany, 0)
+    fetchall = _timed(sqlite3.Cursor.fetchall, 0)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose shortcut execute methods go through TimedCursor."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def connect(database=None):
+    """Open a new tuned connection. Most callers should use get_db() instead."""
+    db = sqlite3.connect(
+        database or DATABASE,
+        factory=TimedConnection,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # Only used by its owning thread, but closed from close_all_connections()
+    )
     db.row_factory = sqlite3.Row
+    for pragma, value in CONNECTION_PRAGMAS:
+        db.execute(f'PRAGMA {pragma} = {value}')
     return db
 
-def get_task(task_id):
-    db = get_db()
-    cursor = db.execute('SELECT id, description, due_date, completed, last_notification, next_action, priority FROM tasks WHERE id = ?', (task_id,))
-    task = dict(cursor.fetchone())
-    
-    # Format dates and check overdue status
-    due_date = parse_date(task['due_date'])
-    task['due_date_display'] = format_date(due_date)
-    task['is_overdue'] = due_date < date.today() and not task['completed']
+class _ConnectionOwner:
+    """
+    Kept in a thread's locals next to its connection. Thread locals are freed when the thread
+    exits, so this closes the connection of threads that do not outlive a request (the threaded
+    dev server starts one per request) instead of leaving it open until the process exits.
+    """
+    __slots__ = ('db',)
 
-    return task
+    def __init__(self, db):
+        self.db = db
 
-def get_overdue_tasks():
+    def __del__(self):
+        try:
+            self.db.close()
+        except sqlite3.Error:
+            pass
+
+def get_db():
+    """
+    Return this thread's connection, opening it on first use.
+    The connection is kept for the lifetime of the thread (or process), so both
+    Flask requests and melgar.py runs reuse a single warm connection and its statement cache.
+    """
+    db = getattr(_local, 'db', None)
+    if db is None or _local.pid != os.getpid():
+        # A connection inherited across a fork (e.g. gunicorn --preload) must not be reused
+        db = _local.db = connect()
+        _local.owner = _ConnectionOwner(db)
+        _local.pid = os.getpid()
+        with _connections_lock:
+            _connections.add(db)
+    return db
+
+def release_db(exception=None):
+    """
+    End-of-request hook: roll back anything left uncommitted so the
+    persistent connection is returned to a clean state.
+    """
+    db = getattr(_local, 'db', None)
+    if db is not None and db.in_transaction:
+        db.rollback()
+
+def close_db():
+    """Close this thread's connection, if any."""
+    db = getattr(_local, 'db', None)
+    if db is not None:
+        _local.db = _local.owner = None
+        with _connections_lock:
+            _connections.discard(db)
+        db.close()
+
+@atexit.register
+def close_all_connections():
+    """Close every connection opened by this process (runs at interpreter exit for CLI/cron use)."""
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+    for db in connections:
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+
+# --- Transactions ---
+
+def in_transaction():
+    """Whether this thread is inside a transaction() block."""
+    return getattr(_local, 'transaction_depth', 0) > 0
+
+@contextlib.contextmanager
+def transaction():
+    """
+    Run several write helpers as one unit of work: inside the block the helpers leave committing
+    (and rolling back) to the block, which commits once when the outermost block exits,
+    or rolls everything back if it raises. Blocks can be nested.
+    """
     db = get_db()
-    cursor = db.execute('SELECT * FROM tasks WHERE completed = 0 AND due_date < CURRENT_DATE')
-    tasks = [dict(x) for x in cursor.fetchall()]
-    return tasks
+    outermost = not in_transaction()
+    _local.transaction_depth = getattr(_local, 'transaction_depth', 0) + 1
+    try:
+        yield db
+        if outermost:
+            db.commit()
+    except BaseException:
+        if outermost:
+            db.rollback()
+        raise
+    finally:
+        _local.transaction_depth -= 1
+        if outermost:
+            # The snapshot may hold versions of uncommitted (or now rolled back) writes
+            invalidate_cache()
+
+def commit(db):
+    """Commit a write helper's changes, unless a transaction() block will commit them."""
+    if not in_transaction():
+        db.commit()
+
+def rollback(db):
+    """Roll back a failed write helper, unless a transaction() block will roll back (the exception propagates to it)."""
+    if not in_transaction():
+        db.rollback()
+
+# --- Query Cache ---
+
+CACHE_TTL = 300  # Seconds a cached result may be served for
+CACHE_MAX_ENTRIES = 256
+
+class QueryCache:
+    """
+    Bounded in-process LRU cache for read queries.
+    Entries are stamped with the versions of the tables they read (see get_table_versions) and
+    only served while those are unchanged; they also expire after CACHE_TTL seconds and never
+    outlive the day they were computed on.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, versions, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, versions):
+        """Return (True, value) on a hit, (False, None) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time() or entry[1] != versions:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[2]
+
+    def set(self, key, value, versions):
+        now = time.time()
+        tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time()).timestamp()
+        expires_at = min(now + self.ttl, tomorrow)
+        with self._lock:
+            self._entries[key] = (expires_at, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries)}
+
+query_cache = QueryCache()
+
+_latest_versions = {}  # Newest version of each table any thread of this process has read
+_latest_versions_lock = threading.Lock()
+
+def read_table_versions():
+    """
+    Read the version of every cacheable table, bumped by triggers on each write to it, whichever
+    connection or process made it (a single read of the table_versions table).
+    """
+    versions = dict(get_db().execute('SELECT name, version FROM table_versions').fetchall())
+    with _latest_versions_lock:
+        for name, version in versions.items():
+            if version > _latest_versions.get(name, -1):
+                _latest_versions[name] = version
+    return versions
+
+def snapshot_table_versions():
+    """
+    Start-of-request hook: read the table versions once, for every cached read and the ETag of this request.
+    Without a snapshot (CLI commands, melgar.py) each cached read checks the versions itself.
+    """
+    _local.table_versions = read_table_versions()
+
+def release_table_versions(exception=None):
+    """End-of-request hook: drop the snapshot, so it cannot leak into the next use of the thread."""
+    _local.table_versions = None
+
+def get_table_versions():
+    versions = getattr(_local, 'table_versions', None)
+    return versions if versions is not None else read_table_versions()
+
+def invalidate_cache(*tables):
+    """
+    Called by every write path with the tables it modified. Entries of those tables are left
+    stale by the version bump; this re-reads the request's snapshot so its later reads see the write.
+    """
+    if getattr(_local, 'table_versions', None) is not None:
+        snapshot_table_versions()
+
+def cached(*tables):
+    """
+    Cache a read function's result per arguments and date, until one of `tables` is written.
+    Cached results are shared between callers and must be treated as read-only.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if in_transaction():
+                # Could read (and would cache) writes that are not committed yet
+                return func(*args, **kwargs)
+            all_versions = get_table_versions()
+            # Read before computing: data read afterwards is at least this new, never older
+            versions = tuple(all_versions[table] for table in tables)
+            key = (func.__name__, args, tuple(sorted(kwargs.items())), date.today())
+            hit, value = query_cache.get(key, versions)
+            if not hit:
+                value = func(*args, **kwargs)
+                with _latest_versions_lock:
+                    # Another thread already saw a newer write: the entry could never be served
+                    current = all(_latest_versions.get(table, -1) <= version for table, version in zip(tables, versions))
+                if current:
+                    query_cache.set(key, value, versions)
+            return value
+        return wrapper
+    return decorator
+
+def get_cache_stats():
+    return query_cache.stats()
+
+def reset_cache():
+    """Drop every cached entry and the table versions seen so far (the database was replaced or migrated)."""
+    query_cache.clear()
+    with _latest_versions_lock:
+        _latest_versions.clear()
+
+def get_data_version():
+    """
+    Return the global data version, which changes whenever any task, action, note, goal, habit
+    or random thing is written: the sum of the table versions, from the request's snapshot if there is one.
+    """
+    return sum(get_table_versions().values())
+
+# --- Schema Migrations ---
+
+def get_migrations():
+    """Return (version, name, path) for every migration file, ordered by version."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+def get_schema_version(db=None):
+    if not db:
+        db = get_db()
+    db.execute(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_date DATE NOT NULL)'
+    )
+    version = db.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+    return version or 0
+
+def migrate_db(db=None):
+    """
+    Apply every migration newer than the current schema version.
+    Each migration runs in its own transaction together with its schema_version row,
+    so an existing database is upgraded in place and a failed migration leaves it untouched.
+    Returns the list of applied (version, name) pairs.
+    """
+    if not db:
+        db = get_db()
+    current_version = get_schema_version(db)
+    applied = []
+    for version, name, path in get_migrations():
+        if version <= current_version:
+            continue
+        with open(path) as f:
+            script = f.read()
+        try:
+            db.executescript(
+                'BEGIN;\n' + script + '\n'
+                f"INSERT INTO schema_version (version, name, applied_date) VALUES ({version}, '{name}', '{get_db_date()}');\n"
+                'COMMIT;'
+            )
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        applied.append((version, name))
+    if applied:
+        reset_cache()
+    return applied
+
+# The hot queries exactly as the functions build them (from the same constants and builders),
+# with representative parameters, and the indexes their plans must use: every step of a plan
+# that reads a table or sorts has to name one of them, so a query that drifts onto another index fails
+# get_tasks() sorts the tasks completed today, which its completed branch reads from idx_tasks_open
+SORT_TODAY = 'USE TEMP B-TREE FOR ORDER BY'
+
+INDEXED_QUERIES = {
+    'get_tasks': (lambda: build_tasks_query(limit=TASK_PAGE_SIZE), ('idx_tasks_open', SORT_TODAY)),
+    'get_tasks_after': (lambda: build_tasks_query(limit=TASK_PAGE_SIZE, after=('2000-01-01', 0)),
+                        ('idx_tasks_open', SORT_TODAY)),
+    'get_tasks_given_up': (lambda: build_tasks_query(given_up=True), ('idx_tasks_open', SORT_TODAY)),
+    'get_task_list_item': (lambda: (TASK_LIST_ITEM_SQL, (1, '2000-01-01')), ('PRIMARY KEY',)),
+    'get_overdue_tasks': (lambda: build_overdue_tasks_query(), ('idx_tasks_completed_due_date',)),
+    'get_overdue_tasks_unnotified': (lambda: build_overdue_tasks_query(unnotified=True),
+                                     ('idx_tasks_completed_due_date',)),
+    # Either index reads only open tasks; which one is picked depends on the statistics
+    'get_unnotified_overdue_task_ids': (lambda: (UNNOTIFIED_OVERDUE_SQL, ('2000-01-01', '2000-01-01')),
+                                        ('idx_tasks_open', 'idx_tasks_completed_due_date')),
+    'get_earliest_open_due_date': (lambda: (EARLIEST_OPEN_DUE_DATE_SQL, ()), ('idx_tasks_open',)),
+    'get_priority_task': (lambda: (PRIORITY_TASK_SQL, ()), ('idx_tasks_priority_due_date',)),
+    'get_actions': (lambda: (ACTIONS_SQL, (1,)), ('idx_task_actions_task_date',)),
+    # Habits are few and all of them are listed
+    'get_habit_states': (lambda: (HABIT_STATES_SQL, ()),
+                         ('idx_tasks_habit', 'SCAN habits', 'AUTOMATIC COVERING INDEX')),
+    # MIN and MAX of the rowid are read from the ends of the table b-tree
+    'get_random_thing_range': (lambda: (build_random_thing_queries()[0], ()), ('SEARCH random_things_to_do',)),
+    'get_random_thing_next': (lambda: (build_random_thing_queries()[2], (1,)), ('PRIMARY KEY',)),
+    'get_random_thing_range_incomplete': (lambda: (build_random_thing_queries(True)[0], ()),
+                                          ('idx_random_things_completed',)),
+    'get_random_thing_probe_incomplete': (lambda: (build_random_thing_queries(True)[1], (1,)), ('PRIMARY KEY',)),
+    'get_random_thing_next_incomplete': (lambda: (build_random_thing_queries(True)[2], (1,)),
+                                         ('idx_random_things_completed',)),
+    'get_notes': (lambda: build_notes_query(limit=NOTE_PAGE_SIZE), ('idx_notes_created_date',)),
+    'get_notes_after': (lambda: build_notes_query(limit=NOTE_PAGE_SIZE, after=('2100-01-01', 0)),
+                        ('idx_notes_created_date',)),
+    'get_notes_by_type': (lambda: build_notes_query(limit=NOTE_PAGE_SIZE, after=('2100-01-01', 0), note_type='idea'),
+                          ('idx_notes_type_created_date',)),
+    'get_next_outbox_attempt': (lambda: (NEXT_OUTBOX_ATTEMPT_SQL, ()), ('idx_outbox_due',)),
+    'get_activity_data': (lambda: (ACTIVITY_SQL, ('2000-01-01',)), ('PRIMARY KEY',)),
+}
+
+def get_unexpected_steps(plan, expected):
+    """
+    The EXPLAIN QUERY PLAN lines that read a table or sort without naming one of the expected
+    indexes (or other allowed steps, such as the temporary b-tree get_tasks() sorts today's completions in).
+    """
+    return [
+        line for line in plan
+        if (line.startswith(('SCAN', 'SEARCH')) or 'TEMP B-TREE' in line)
+        and line != 'SCAN CONSTANT ROW' and not any(name in line for name in expected)
+    ]
+
+def check_query_plans(db=None):
+    """
+    Run EXPLAIN QUERY PLAN over INDEXED_QUERIES.
+    Returns a dict of query name -> plan lines for every query whose plan reads a table
+    or sorts without one of its expected indexes (an empty dict means all queries are indexed as intended).
+    """
+    if not db:
+        db = get_db()
+    failures = {}
+    for name, (build, expected) in INDEXED_QUERIES.items():
+        sql, params = build()
+        plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+        if get_unexpected_steps(plan, expected):
+            failures[name] = plan
+    return failures
+
+def get_task(task_id):
+    """Get a task by id, or None if it does not exist."""
+    return fetch_row(TaskDetail, f'SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?', (task_id,))
+
+def build_overdue_tasks_query(unnotified=False, today=None):
+    """SQL and parameters for get_overdue_tasks()."""
+    today = get_db_date(today)
+    sql = f'SELECT {TASK_COLUMNS} FROM tasks WHERE completed = 0 AND due_date < ?'
+    params = [today]
+    if unnotified:
+        sql += ' AND (last_notification IS NULL OR last_notification < ?)'
+        params.append(today)
+    return sql, params
+
+def get_overdue_tasks(unnotified=False, today=None):
+    """
+    Get incomplete tasks due before today.
+    With unnotified=True, tasks that were already notified today are left out in SQL.
+    """
+    return fetch_rows(Task, *build_overdue_tasks_query(unnotified, today))
 
 def set_last_notification(task, notification_date=None):
     """
@@ -79,81 +664,98 @@ def set_last_notification(task, notification_date=None):
     
     db = get_db()
     db.execute('UPDATE tasks SET last_notification = ? WHERE id = ?', (notification_date or today, task['id']))
-    db.commit()
+    commit(db)
+    invalidate_cache('tasks')
+
+def set_last_notifications(task_ids, notification_date=None):
+    """Sets last_notification for several tasks in one transaction (or in the caller's transaction() block)."""
+    if not task_ids:
+        return
+    notification_date = notification_date or date.today()
 
-def get_activity_data(days=21):
+    db = get_db()
+    db.executemany('UPDATE tasks SET last_notification = ? WHERE id = ?',
+                   [(notification_date, task_id) for task_id in task_ids])
+    commit(db)
+    invalidate_cache('tasks')
+
+EARLIEST_OPEN_DUE_DATE_SQL = 'SELECT MIN(due_date) FROM tasks WHERE give_up = 0 AND completion_date IS NULL AND completed = 0'
+
+def get_earliest_open_due_date():
+    """Earliest due date among open tasks, or None if there are none (a single idx_tasks_open lookup)."""
+    db = get_db()
+    row = db.execute(EARLIEST_OPEN_DUE_DATE_SQL).fetchone()
+    return parse_date(row[0])
+
+UNNOTIFIED_OVERDUE_SQL = (
+    'SELECT id FROM tasks WHERE give_up = 0 AND completion_date IS NULL AND completed = 0 AND due_date < ? '
+    'AND (last_notification IS NULL OR last_notification < ?)'
+)
+
+def get_unnotified_overdue_task_ids(today=None):
+    """Ids of the overdue tasks that have not been notified today."""
+    today = get_db_date(today)
+    db = get_db()
+    return [row[0] for row in db.execute(UNNOTIFIED_OVERDUE_SQL, (today, today)).fetchall()]
+
+ACTIVITY_SQL = (
+    'SELECT day, actions + notes + tasks_created AS actions, task_completions + goal_completions AS completions '
+    'FROM daily_activity WHERE day >= ?'
+)
+
+@cached('tasks', 'task_actions', 'notes', 'goals')
+def get_activity_data(days=21, today=None):
     """
-    Get activity data for the past 21 days for GitHub-style activity graph
+    Get activity data for the `days` days up to `today` (default: today) for GitHub-style activity graph
+    Reads the daily_activity rollup (kept current by triggers), so any window is a single primary key range read.
     Returns a dictionary with:
     - date strings as keys (YYYY-MM-DD format)
     - dictionary values containing counts for 'actions' and 'completions'
     """
-    # Initialize result with the period
-    today = date.today()
-    
-    # Get database connection
+    today = today or date.today()
     db = get_db()
-    
-    # Get task actions for the period
+
     start_date = get_db_date(today - timedelta(days=days-1))
-    actions = db.execute(
-        'SELECT action_date, COUNT(*) as count FROM task_actions '
-        'WHERE action_date >= ? GROUP BY action_date', 
-        (start_date,)
-    ).fetchall()
-    
-    # Get notes for the period
-    notes = db.execute(
-        'SELECT created_date, COUNT(*) as count FROM notes '
-        'WHERE created_date >= ? GROUP BY created_date', 
-        (start_date,)
-    ).fetchall()
-
-    # Get completed tasks for the period
-    task_completions = db.execute(
-        'SELECT completion_date, COUNT(*) as count FROM tasks '
-        'WHERE completion_date >= ? AND completed = 1 GROUP BY completion_date', 
-        (start_date,)
-    ).fetchall()
-    
-    # Get created tasks for the period
-    tasks_created = db.execute(
-        'SELECT created_date, COUNT(*) as count FROM tasks '
-        'WHERE created_date >= ? GROUP BY created_date', 
-        (start_date,)
-    ).fetchall()
-    
-    # Get completed goals for the period
-    goal_completions = db.execute(
-        'SELECT completion_date, COUNT(*) as count FROM goals '
-        'WHERE completion_date >= ? AND completed = 1 GROUP BY completion_date', 
-        (start_date,)
-    ).fetchall()
-
-    # Convert the list results to dictionaries for easier lookup
-    actions_dict = {row['action_date']: row['count'] for row in actions}
-    tasks_created_dict = {row['created_date']: row['count'] for row in tasks_created}
-    task_completions_dict = {row['completion_date']: row['count'] for row in task_completions}
-    goal_completions_dict = {row['completion_date']: row['count'] for row in goal_completions}
-    notes_dict = {row['created_date']: row['count'] for row in notes}
+    rows = db.execute(ACTIVITY_SQL, (start_date,)).fetchall()
+    activity_dict = {row['day']: row for row in rows}
 
     result = {}
     # Create entries for each of the days
     for i in range(days):
-        day = today - timedelta(days=i) 
-        day_str = get_db_date(day)
-
-        actions_date = actions_dict.get(day_str, 0)
-        tasks_created_date = tasks_created_dict.get(day_str, 0)
-        task_completions_date = task_completions_dict.get(day_str, 0)
-        goal_completions_date = goal_completions_dict.get(day_str, 0)
-        notes_date = notes_dict.get(day_str, 0)
+        day_str = get_db_date(today - timedelta(days=i))
+        row = activity_dict.get(day_str)
+        result[day_str] = {"actions": row['actions'] if row else 0,
+                           "completions": row['completions'] if row else 0}
 
-        result[day_str] = {"actions": actions_date+notes_date+tasks_created_date,
-                           "completions": task_completions_date+goal_completions_date}
-    
     return result
 
+def rebuild_daily_activity(db=None):
+    """Recompute the daily_activity rollup from scratch (backfill, or repair after out-of-band edits)."""
+    if not db:
+        db = get_db()
+    try:
+        db.execute('DELETE FROM daily_activity')
+        db.execute('''
+            INSERT INTO daily_activity (day, actions, notes, tasks_created, task_completions, goal_completions)
+            SELECT day, SUM(actions), SUM(notes), SUM(tasks_created), SUM(task_completions), SUM(goal_completions)
+            FROM (
+                SELECT action_date AS day, 1 AS actions, 0 AS notes, 0 AS tasks_created, 0 AS task_completions, 0 AS goal_completions FROM task_actions
+                UNION ALL SELECT created_date, 0, 1, 0, 0, 0 FROM notes
+                UNION ALL SELECT created_date, 0, 0, 1, 0, 0 FROM tasks
+                UNION ALL SELECT completion_date, 0, 0, 0, 1, 0 FROM tasks WHERE completed = 1 AND completion_date IS NOT NULL
+                UNION ALL SELECT completion_date, 0, 0, 0, 0, 1 FROM goals WHERE completed = 1 AND completion_date IS NOT NULL
+            )
+            WHERE day IS NOT NULL
+            GROUP BY day
+        ''')
+        db.commit()
+        query_cache.clear()
+    except Exception as e:
+        db.rollback()
+        raise e
+    return db.execute('SELECT COUNT(*) FROM daily_activity').fetchone()[0]
+
+@cached('goals')
 def get_current_goal():
     db = get_db()
     cursor = db.cursor()
@@ -169,79 +771,68 @@ def get_current_goal():
         return dict(goal)
     return None
 
-def get_tasks(given_up=False):
-    db = get_db()
-    if given_up:
-        cursor = db.execute('SELECT id, description, due_date, completed, goal_id, completion_date, next_action, priority FROM tasks WHERE give_up = 1 ORDER BY due_date ASC')
-    else:
-        cursor = db.execute('SELECT id, description, due_date, completed, goal_id, completion_date, next_action, priority FROM tasks WHERE give_up = 0 OR give_up IS NULL ORDER BY due_date ASC')
+TASK_PAGE_SIZE = 50
 
-    tasks_raw = cursor.fetchall()
+def build_tasks_query(given_up=False, limit=None, after=None, today=None):
+    """SQL and parameters for get_tasks()."""
+    # One branch per index range so the open branch is read in (due_date, id) order
+    # and LIMIT can stop early; only today's completions need sorting. The completed branch
+    # is pinned to idx_tasks_open: ordered by due date instead, SQLite would walk the whole history
+    branch = f'SELECT {TASK_COLUMNS} FROM tasks{{}} WHERE give_up = ? AND {{}}'
+    keyset = ' AND (due_date, id) > (?, ?)' if after else ''
+    give_up = 1 if given_up else 0
+    sql = (branch.format('', 'completion_date IS NULL' + keyset) + ' UNION ALL ' +
+           branch.format(' INDEXED BY idx_tasks_open', 'completion_date >= ?' + keyset) +
+           ' ORDER BY due_date ASC, id ASC')
+    params = [give_up, *(after or ()), give_up, get_db_date(today), *(after or ())]
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
 
-    tasks = []
-    today = date.today()
-    for task in tasks_raw:
-        task_dict = dict(task) # Convert Row object to dict
-        
-        # Check if completion date is earlier than today
-        if task['completion_date']:
-            completion_date_obj = parse_date(task['completion_date'])
-            earlier_than_today = completion_date_obj and completion_date_obj < today
-        else:
-            earlier_than_today = False
-        
-        if not earlier_than_today:
-            # Parse the due date and format it for display
-            due_date_obj = parse_date(task['due_date'])
-
-            if due_date_obj:
-                # Format for display (DD/MMM)
-                task_dict['due_date_display'] = format_date(due_date_obj, '%d/%b')
-                task_dict['is_overdue'] = not task['completed'] and due_date_obj < today
-            else:
-                task_dict['due_date_display'] = "Invalid Date"
-                task_dict['is_overdue'] = False
-                
-            tasks.append(task_dict)
-    
-    return tasks
+@cached('tasks')
+def get_tasks(given_up=False, limit=None, after=None):
+    """
+    Get open tasks plus tasks completed today, ordered by (due_date, id).
+    Tasks completed before today are filtered out in SQL (served by idx_tasks_open),
+    so the cost follows the open task list rather than all-time history.
+    For keyset pagination pass limit and, for the following pages, after=(due_date, id)
+    of the last task already shown (see get_task_cursor).
+    """
+    return fetch_rows(Task, *build_tasks_query(given_up, limit, after))
+
+TASK_LIST_ITEM_SQL = (
+    f'SELECT {TASK_COLUMNS} FROM tasks '
+    'WHERE id = ? AND give_up = 0 AND (completion_date IS NULL OR completion_date >= ?)'
+)
+
+def get_task_list_item(task_id):
+    """Get a single task shaped like get_tasks() rows, or None if it is not shown in the task list."""
+    return fetch_row(Task, TASK_LIST_ITEM_SQL, (task_id, get_db_date()))
+
+def get_next_task_id(task):
+    """Id of the task that follows task in the task list order, or None if it is the last one."""
+    next_tasks = get_tasks(limit=1, after=(task['due_date'], task['id']))
+    return next_tasks[0]['id'] if next_tasks else None
+
+def get_task_cursor(tasks, limit):
+    """Return the (due_date, id) cursor for the page after tasks, or None if this was the last page."""
+    if not limit or len(tasks) < limit:
+        return None
+    return (tasks[-1]['due_date'], tasks[-1]['id'])
+
+# Incomplete tasks with priority=1, ordered by due date
+PRIORITY_TASK_SQL = f'SELECT {TASK_COLUMNS} FROM tasks WHERE completed = 0 AND priority = 1 ORDER BY due_date ASC LIMIT 1'
 
+@cached('tasks')
 def get_priority_task():
     """Get the highest priority task with the earliest due date."""
-    db = get_db()
-    # Query for incomplete tasks with priority=1, ordered by due date
-    cursor = db.execute(
-        'SELECT id, description, due_date, next_action FROM tasks '
-        'WHERE completed = 0 AND priority = 1 '
-        'ORDER BY due_date ASC LIMIT 1'
-    )
-    task = cursor.fetchone()
-    
-    if not task:
-        return None
-    
-    task_dict = dict(task)
-    
-    # Format the due date for display
-    due_date_obj = parse_date(task['due_date'])
-    if due_date_obj:
-        task_dict['due_date_display'] = format_date(due_date_obj, '%d/%b')
-    else:
-        task_dict['due_date_display'] = "Unknown"
-    
-    return task_dict
+    return fetch_row(Task, PRIORITY_TASK_SQL)
 
-def get_actions(task_id):
-    db = get_db()
-    cursor = db.execute('SELECT id, action_description, action_date FROM task_actions WHERE task_id = ? ORDER BY action_date DESC', (task_id,))
-    actions_raw = cursor.fetchall()
+ACTIONS_SQL = 'SELECT id, action_description, action_date FROM task_actions WHERE task_id = ? ORDER BY action_date DESC'
 
-    actions = []
-    for action in actions_raw:
-        action_dict = dict(action)
-        action_dict['action_date_display'] = get_display_date(action['action_date'])
-        actions.append(action_dict)
-    return actions
+def get_actions(task_id):
+    return fetch_rows(Action, ACTIONS_SQL, (task_id,))
 
 def get_action(action_id):
     db = get_db()
@@ -255,24 +846,41 @@ def get_note(note_id):
     note = cursor.fetchone()
     return dict(note)
 
-def get_notes():
-    db = get_db()
-    cursor = db.execute('SELECT id, title, note, type, created_date FROM notes ORDER BY created_date DESC')
-    notes_raw = cursor.fetchall()
-    
-    notes = []
-    for note in notes_raw:
-        note_dict = dict(note)
-        # Format the date using our utility function
-        note_dict['created_date'] = get_display_date(note['created_date'], short=True)
-        
-        # Truncate note preview
-        if len(note_dict['note']) > 150:
-            note_dict['note'] = note_dict['note'][:150] + '...'
-            
-        notes.append(note_dict)
-    
-    return notes
+NOTE_PREVIEW_LENGTH = 150
+NOTE_PAGE_SIZE = 30
+
+def build_notes_query(limit=None, after=None, note_type=None):
+    """SQL and parameters for get_notes()."""
+    sql = ('SELECT id, title, substr(note, 1, ?) AS note, length(note) > ? AS has_more, type, created_date '
+           'FROM notes WHERE 1 = 1')
+    params = [NOTE_PREVIEW_LENGTH, NOTE_PREVIEW_LENGTH]
+    if note_type:
+        sql += ' AND type = ?'
+        params.append(note_type)
+    if after:
+        sql += ' AND (created_date, id) < (?, ?)'
+        params.extend(after)
+    sql += ' ORDER BY created_date DESC, id DESC'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+def get_notes(limit=None, after=None, note_type=None):
+    """
+    Get notes, newest first, with only a preview of each body: the first NOTE_PREVIEW_LENGTH
+    characters are cut in SQL and has_more tells whether the note is longer.
+    Full bodies are only loaded by get_note().
+    For keyset pagination pass limit and, for the following pages, after=(created_date, id)
+    of the last note already shown (see get_note_cursor). note_type filters by type.
+    """
+    return fetch_rows(NoteSummary, *build_notes_query(limit, after, note_type))
+
+def get_note_cursor(notes, limit):
+    """Return the (created_date, id) cursor for the page after notes, or None if this was the last page."""
+    if not limit or len(notes) < limit:
+        return None
+    return (notes[-1]['created_date'], notes[-1]['id'])
 
 def insert_action(task_id, action_description, action_date):
     db = get_db()
@@ -283,32 +891,37 @@ def insert_action(task_id, action_description, action_date):
         'INSERT INTO task_actions (task_id, action_description, action_date) VALUES (?, ?, ?)',
         (task_id, action_description, action_date)
     )
-    db.commit()
+    commit(db)
+    invalidate_cache('task_actions')
     return True
 
 def delete_task(task_id):
     db = get_db()
     db.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-    db.commit()
+    commit(db)
+    invalidate_cache('tasks')
     return True
 
 def give_up_task(task_id):
     db = get_db()
     # Set the give_up flag to True and clear the due_date
     db.execute('UPDATE tasks SET give_up = 1 WHERE id = ?', (task_id,))
-    db.commit()
+    commit(db)
+    invalidate_cache('tasks')
     return True
 
 def delete_action(action_id):
     db = get_db()
     db.execute('DELETE FROM task_actions WHERE id = ?', (action_id,))
-    db.commit()
+    commit(db)
+    invalidate_cache('task_actions')
     return True
 
 def delete_note(note_id):
     db = get_db()
     db.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-    db.commit()
+    commit(db)
+    invalidate_cache('notes')
     return True
 
 def update_task(task_id, task_data):
@@ -323,18 +936,120 @@ def update_goal(goal_id, goal_data):
     update_table('goals', goal_id, goal_data)
     return True
 
+# Columns that update_table/update_many may set, per table
+UPDATABLE_COLUMNS = {
+    'tasks': {'description', 'due_date', 'completed', 'last_notification', 'completion_date',
+              'next_action', 'goal_id', 'priority', 'give_up', 'habit_id'},
+    'notes': {'title', 'note', 'type'},
+    'goals': {'description', 'target_date', 'completed', 'completion_date'},
+    'habits': {'description', 'periodicity'},
+    'random_things_to_do': {'description', 'completed', 'completion_date', 'link'},
+}
+
+def build_update_sql(table, columns):
+    """Build a single UPDATE statement for the given columns, validated against UPDATABLE_COLUMNS."""
+    allowed = UPDATABLE_COLUMNS.get(table)
+    if allowed is None:
+        raise ValueError(f'Table {table!r} cannot be updated.')
+    invalid = [column for column in columns if column not in allowed]
+    if invalid:
+        raise ValueError(f'Invalid column(s) for {table}: {", ".join(invalid)}')
+    if not columns:
+        raise ValueError('No columns to update.')
+    assignments = ', '.join(f'{column} = ?' for column in columns)
+    return f'UPDATE {table} SET {assignments} WHERE id = ?'
+
 def update_table(table, id, data):
     db = get_db()
+    columns = list(data)
+    sql = build_update_sql(table, columns)
     try:
-        for key, value in data.items():
-            sql = f'UPDATE {table} SET {key} = ? WHERE id = ?'
-            db.execute(sql, (value, id))
-        db.commit()
+        db.execute(sql, [data[column] for column in columns] + [id])
+        commit(db)
+        invalidate_cache(table)
+    except Exception as e:
+        rollback(db) # Rollback in case of error
+        raise e
+
+def update_many(table, updates):
+    """
+    Apply several updates in one transaction.
+    updates is a list of (id, data) pairs; rows updating the same set of columns
+    share one executemany statement.
+    """
+    statements = {}
+    for id, data in updates:
+        columns = tuple(data)
+        statements.setdefault(columns, []).append([data[column] for column in columns] + [id])
+    sqls = {columns: build_update_sql(table, columns) for columns in statements}
+
+    db = get_db()
+    try:
+        for columns, rows in statements.items():
+            db.executemany(sqls[columns], rows)
+        commit(db)
+        invalidate_cache(table)
     except Exception as e:
-        db.rollback() # Rollback in case of error
+        rollback(db) # Rollback in case of error
         raise e
 
 
+BULK_OPERATIONS = ('complete', 'snooze', 'reset_date', 'give_up', 'priority')
+SNOOZE_DAYS = (1, 3, 7, 30)
+
+def bulk_update_tasks(task_ids, operation, days=None, priority=None, action_description=None, today=None):
+    """
+    Apply one operation to several tasks in a single transaction:
+    'complete', 'snooze' (move the due date `days` later), 'reset_date' (due today),
+    'give_up' or 'priority' (set priority to `priority`).
+    Snoozes and date resets also record a task_actions row per task, with action_description
+    if given. Tasks that do not exist, or are already completed or given up, are skipped.
+    Returns the ids of the tasks that were changed.
+    """
+    if operation not in BULK_OPERATIONS:
+        raise ValueError(f'Unknown bulk operation {operation!r}.')
+    if operation == 'snooze' and days not in SNOOZE_DAYS:
+        raise ValueError('Invalid snooze duration.')
+    task_ids = list(task_ids)
+    if not task_ids:
+        return []
+    today = get_db_date(today)
+
+    db = get_db()
+    # Completed tasks can still have their priority changed, like from the task page
+    condition = 'give_up = 0' if operation == 'priority' else 'give_up = 0 AND completed = 0'
+    cursor = db.execute(f'SELECT id FROM tasks WHERE id IN ({", ".join("?" * len(task_ids))}) AND {condition}', task_ids)
+    task_ids = [row[0] for row in cursor.fetchall()]
+    if not task_ids:
+        return []
+
+    if operation == 'complete':
+        sql, rows = 'UPDATE tasks SET completed = 1, completion_date = ? WHERE id = ?', [(today, id) for id in task_ids]
+    elif operation == 'snooze':
+        sql, rows = "UPDATE tasks SET due_date = date(due_date, ?) WHERE id = ?", [(f'+{days} days', id) for id in task_ids]
+        action_description = action_description or f"Snoozed for {days} day{'s' if days != 1 else ''}"
+    elif operation == 'reset_date':
+        sql, rows = 'UPDATE tasks SET due_date = ? WHERE id = ?', [(today, id) for id in task_ids]
+        action_description = action_description or "Reset due date to today"
+    elif operation == 'give_up':
+        sql, rows = 'UPDATE tasks SET give_up = 1 WHERE id = ?', [(id,) for id in task_ids]
+    else:
+        sql, rows = 'UPDATE tasks SET priority = ? WHERE id = ?', [(1 if priority else 0, id) for id in task_ids]
+
+    try:
+        db.executemany(sql, rows)
+        if operation in ('snooze', 'reset_date'):
+            db.executemany(
+                'INSERT INTO task_actions (task_id, action_description, action_date) VALUES (?, ?, ?)',
+                [(id, action_description, today) for id in task_ids]
+            )
+        commit(db)
+    except Exception as e:
+        rollback(db)
+        raise e
+    invalidate_cache('tasks', 'task_actions')
+    return task_ids
+
 def insert_goal(description, created_date, target_date):
     db = get_db()
     # Ensure dates are in database format
@@ -347,7 +1062,8 @@ def insert_goal(description, created_date, target_date):
         'INSERT INTO goals (description, created_date, target_date, completed) VALUES (?, ?, ?, 0)',
         (description, created_date, target_date)
     )
-    db.commit()
+    commit(db)
+    invalidate_cache('goals')
     return True
 
 def insert_note(title, note_content, note_type, created_date):
@@ -360,10 +1076,12 @@ def insert_note(title, note_content, note_type, created_date):
         'INSERT INTO notes (title, note, type, created_date) VALUES (?, ?, ?, ?)',
         (title, note_content, note_type, created_date)
     )
-    db.commit()
+    commit(db)
+    invalidate_cache('notes')
     return True
 
 def insert_task(description, due_date, goal_id=None, habit_id=None):
+    """Insert a task and return its id."""
     db = get_db()
     # Ensure due_date is in database format
     if isinstance(due_date, date):
@@ -371,54 +1089,96 @@ def insert_task(description, due_date, goal_id=None, habit_id=None):
 
     created_date = get_db_date()  # Use today's date as created date    
     
-    db.execute(
+    cursor = db.execute(
         'INSERT INTO tasks (description, due_date, goal_id, habit_id, created_date) VALUES (?, ?, ?, ?, ?)',
         (description, due_date, goal_id, habit_id, created_date)
     )
     
-    db.commit()
-    return True
+    commit(db)
+    invalidate_cache('tasks')
+    return cursor.lastrowid
+
+def insert_tasks(tasks):
+    """
+    Insert several tasks in a single transaction.
+    tasks is an iterable of dicts with 'description' and 'due_date', and optional 'goal_id'/'habit_id'.
+    Returns the number of tasks inserted.
+    """
+    db = get_db()
+    created_date = get_db_date()
+    rows = [
+        (task['description'],
+         get_db_date(task['due_date']) if isinstance(task['due_date'], date) else task['due_date'],
+         task.get('goal_id'), task.get('habit_id'), created_date)
+        for task in tasks
+    ]
+    try:
+        db.executemany(
+            'INSERT INTO tasks (description, due_date, goal_id, habit_id, created_date) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+        commit(db)
+        invalidate_cache('tasks')
+    except Exception as e:
+        rollback(db)
+        raise e
+    return len(rows)
 
 # --- Random Things To Do Functions ---
 
-def get_random_thing(thing_id=None):
+RANDOM_THING_PROBES = 3  # Exact id probes before falling back to the next id after a gap
+RANDOM_THING_COLUMNS = 'id, description, completed, completion_date, link'
+
+def build_random_thing_queries(only_incomplete=False):
+    """The id range, exact id probe and next id SQL used by get_random_thing()."""
+    condition = 'completed = 0 AND ' if only_incomplete else ''
+    where = ' WHERE completed = 0' if only_incomplete else ''
+    return (
+        # Separate subqueries, since SQLite only reads MIN or MAX from the end of an index when it is alone
+        f'SELECT (SELECT MIN(id) FROM random_things_to_do{where}), (SELECT MAX(id) FROM random_things_to_do{where})',
+        f'SELECT {RANDOM_THING_COLUMNS} FROM random_things_to_do WHERE {condition}id = ?',
+        f'SELECT {RANDOM_THING_COLUMNS} FROM random_things_to_do WHERE {condition}id >= ? ORDER BY id LIMIT 1',
+    )
+
+def get_random_thing(thing_id=None, only_incomplete=False, sticky=False):
     '''
     Get a random thing to do from the database.
     If thing_id is provided, get that specific thing.
-    Otherwise, get a random random thing to do.
+    Otherwise, get a random random thing to do: pick a random id between the lowest and highest id
+    (an index lookup) and probe for it, so no full column scan is needed. Probes that land in an id gap
+    are retried a few times, then the next existing id is used.
+    only_incomplete restricts the choice to things not completed yet, and
+    sticky makes the choice deterministic for the day (the same suggestion until tomorrow).
     '''
     db = get_db()
     if thing_id is not None:
-        cursor = db.execute('SELECT id, description, completed, completion_date, link FROM random_things_to_do WHERE id = ?', (thing_id,))
+        cursor = db.execute(f'SELECT {RANDOM_THING_COLUMNS} FROM random_things_to_do WHERE id = ?', (thing_id,))
         thing = cursor.fetchone()
     else:
-        # Fetch a random thing if no id is provided
-        cursor = db.execute('SELECT id FROM random_things_to_do')
-        all_ids = [row[0] for row in cursor.fetchall()]
-        if not all_ids:
+        range_sql, probe_sql, next_sql = build_random_thing_queries(only_incomplete)
+        low, high = db.execute(range_sql).fetchone()
+        if low is None:
             return None # No random things in the database
-        random_id = random.choice(all_ids)
-        cursor = db.execute('SELECT id, description, completed, completion_date, link FROM random_things_to_do WHERE id = ?', (random_id,))
-        thing = cursor.fetchone()
+        rng = random.Random(date.today().toordinal()) if sticky else random
+        thing = None
+        for _ in range(RANDOM_THING_PROBES):
+            cursor = db.execute(probe_sql, (rng.randint(low, high),))
+            thing = cursor.fetchone()
+            if thing:
+                break
+        if not thing:
+            cursor = db.execute(next_sql, (rng.randint(low, high),))
+            thing = cursor.fetchone()
 
     if thing:
         return dict(thing)
     return None
 
 def get_random_things():
-    db = get_db()
-    cursor = db.execute('SELECT id, description, completed, completion_date, link FROM random_things_to_do ORDER BY id DESC')
-    things_raw = cursor.fetchall()
-    
-    things = []
-    for thing in things_raw:
-        thing_dict = dict(thing)
-        # Format the completion date if it exists
-        if thing_dict['completion_date']:
-            thing_dict['completion_date_display'] = get_display_date(thing_dict['completion_date'], short=True)
-        things.append(thing_dict)
-    
-    return things
+    return fetch_rows(
+        RandomThing,
+        'SELECT id, description, completed, completion_date, link FROM random_things_to_do ORDER BY id DESC'
+    )
 
 def insert_random_thing(description, link=None):
     db = get_db()
@@ -426,7 +1186,8 @@ def insert_random_thing(description, link=None):
         'INSERT INTO random_things_to_do (description, link, completed) VALUES (?, ?, 0)',
         (description, link)
     )
-    db.commit()
+    commit(db)
+    invalidate_cache('random_things_to_do')
     return True
 
 def toggle_random_thing(thing_id):
@@ -446,16 +1207,244 @@ def toggle_random_thing(thing_id):
                 'UPDATE random_things_to_do SET completed = ?, completion_date = NULL WHERE id = ?',
                 (new_status, thing_id)
             )
-        db.commit()
+        commit(db)
+        invalidate_cache('random_things_to_do')
         return True
     return False
 
 def delete_random_thing(thing_id):
     db = get_db()
     db.execute('DELETE FROM random_things_to_do WHERE id = ?', (thing_id,))
-    db.commit()
+    commit(db)
+    invalidate_cache('random_things_to_do')
     return True
 
+# --- Search Functions ---
+
+SEARCH_RESULTS_LIMIT = 50
+SEARCH_WORD = re.compile(r'\w+', re.UNICODE)
+
+def build_search_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+    Returns None if the text has no searchable words.
+    """
+    words = SEARCH_WORD.findall(text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def highlight_snippet(snippet):
+    """HTML-escape an FTS5 snippet, then turn its \\x02/\\x03 match markers into <mark> tags."""
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search(text, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Full-text search over tasks, task actions and notes, best matches first.
+    Each result has kind ('task', 'action' or 'note'), target_id (the task or note to link to),
+    HTML-safe title and body snippets with the matches highlighted, and for actions the task_description.
+    """
+    query = build_search_query(text)
+    if not query:
+        return []
+    db = get_db()
+    cursor = db.execute('''
+        SELECT m.kind, m.target_id, m.title, m.body, t.description AS task_description
+        FROM (
+            SELECT kind, target_id,
+                   snippet(search_index, 2, char(2), char(3), '…', 12) AS title,
+                   snippet(search_index, 3, char(2), char(3), '…', 24) AS body,
+                   bm25(search_index, 0, 0, 2.0, 1.0) AS score
+            FROM search_index
+            WHERE search_index MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ) m
+        LEFT JOIN tasks t ON m.kind = 'action' AND t.id = m.target_id
+        ORDER BY m.score
+    ''', (query, limit))
+    results = []
+    for row in cursor.fetchall():
+        result = dict(row)
+        result['title'] = highlight_snippet(result['title'])
+        result['body'] = highlight_snippet(result['body'])
+        results.append(result)
+    return results
+
+# --- Notification Outbox Functions ---
+
+def enqueue_notifications(notifications):
+    """
+    Queue notifications for delivery, given as (task_id, message, headers) tuples.
+    A task that already has an undelivered notification is not queued again.
+    Returns the number of notifications queued.
+    """
+    notifications = list(notifications)
+    if not notifications:
+        return 0
+    db = get_db()
+    now = time.time()
+    changes = db.total_changes
+    db.executemany(
+        'INSERT INTO notification_outbox (task_id, message, headers, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?) '
+        "ON CONFLICT (task_id) WHERE status IN ('pending', 'sending') DO NOTHING",
+        [(task_id, message, json.dumps(headers), now, now) for task_id, message, headers in notifications]
+    )
+    commit(db)
+    return db.total_changes - changes
+
+def claim_notifications(limit=50, lease=60):
+    """
+    Take up to `limit` due notifications for delivery, marking them 'sending' for `lease` seconds.
+    Claims are atomic across threads and processes; a claim that expires (the worker died
+    mid-send) makes the notification due again.
+    Returns a list of dicts with id, task_id, message, headers and attempts (including this one).
+    """
+    db = get_db()
+    now = time.time()
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        rows = db.execute(
+            'SELECT id, task_id, message, headers, attempts FROM notification_outbox '
+            "WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+            (now, limit)
+        ).fetchall()
+        db.executemany(
+            "UPDATE notification_outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+            [(now + lease, row['id']) for row in rows]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return [{**dict(row), 'headers': json.loads(row['headers']), 'attempts': row['attempts'] + 1} for row in rows]
+
+def complete_notifications(outbox_ids, notification_date=None):
+    """Mark delivered notifications as sent and set last_notification on their tasks, in one transaction."""
+    settle_notifications([(outbox_id, None) for outbox_id in outbox_ids], 'sent', notification_date)
+
+def settle_notifications(results, status, notification_date=None):
+    """
+    Finish notifications that are not retried, given as (outbox_id, error) tuples, with status 'sent' or
+    'uncertain' (ntfy may have published it before the request failed), and set last_notification on
+    their tasks so they are not queued again today, in one transaction.
+    """
+    if not results:
+        return
+    notification_date = notification_date or date.today()
+    db = get_db()
+    now = time.time()
+    db.executemany(
+        'UPDATE tasks SET last_notification = ? WHERE id = (SELECT task_id FROM notification_outbox WHERE id = ?)',
+        [(notification_date, outbox_id) for outbox_id, _ in results]
+    )
+    db.executemany(
+        'UPDATE notification_outbox SET status = ?, sent_at = ?, last_error = ? WHERE id = ?',
+        [(status, now, error, outbox_id) for outbox_id, error in results]
+    )
+    commit(db)
+    invalidate_cache('tasks')
+
+def fail_notifications(failures):
+    """
+    Record failed delivery attempts, given as (outbox_id, error, retry_at) tuples.
+    retry_at is the unix time of the next attempt, or None to give up (status 'failed').
+    """
+    if not failures:
+        return
+    db = get_db()
+    db.executemany(
+        "UPDATE notification_outbox SET status = CASE WHEN ?1 IS NULL THEN 'failed' ELSE 'pending' END, "
+        'next_attempt_at = COALESCE(?1, next_attempt_at), last_error = ?2 WHERE id = ?3',
+        [(retry_at, error, outbox_id) for outbox_id, error, retry_at in failures]
+    )
+    commit(db)
+
+def postpone_notifications(outbox_ids, retry_at):
+    """Return claimed notifications that were never sent (ntfy's circuit was open) to the queue, without counting the attempt."""
+    if not outbox_ids:
+        return
+    db = get_db()
+    db.executemany(
+        "UPDATE notification_outbox SET status = 'pending', attempts = attempts - 1, next_attempt_at = ? WHERE id = ?",
+        [(retry_at, outbox_id) for outbox_id in outbox_ids]
+    )
+    commit(db)
+
+def enqueue_digest(task_ids, message, headers, notification_date=None):
+    """
+    Queue one digest notification covering several tasks, and set last_notification on all of
+    them in the same transaction: once queued, the outbox guarantees delivery.
+    """
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+    now = time.time()
+    with transaction() as db:
+        db.execute(
+            'INSERT INTO notification_outbox (task_id, message, headers, next_attempt_at, created_at) VALUES (NULL, ?, ?, ?, ?)',
+            (message, json.dumps(headers), now, now)
+        )
+        set_last_notifications(task_ids, notification_date)
+
+NEXT_OUTBOX_ATTEMPT_SQL = "SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status IN ('pending', 'sending')"
+
+def get_next_outbox_attempt():
+    """Unix time at which the next undelivered notification is due, or None if the outbox is empty."""
+    db = get_db()
+    row = db.execute(NEXT_OUTBOX_ATTEMPT_SQL).fetchone()
+    return row[0]
+
+# --- Calendar Events Functions ---
+
+def get_calendar_events(task_ids):
+    """Get the tracked calendar events for the given tasks, as a dict of (task_id, slot) -> row dict."""
+    db = get_db()
+    events = {}
+    task_ids = list(task_ids)
+    # Chunked to stay below SQLite's host parameter limit
+    for offset in range(0, len(task_ids), 500):
+        chunk = task_ids[offset:offset + 500]
+        cursor = db.execute(
+            f'SELECT task_id, slot, event_id, event_date FROM calendar_events WHERE task_id IN ({", ".join("?" * len(chunk))})',
+            chunk
+        )
+        for row in cursor.fetchall():
+            events[(row['task_id'], row['slot'])] = dict(row)
+    return events
+
+def save_calendar_events(events):
+    """Insert or replace tracked calendar events, given as (task_id, slot, event_id, event_date) tuples."""
+    if not events:
+        return
+    db = get_db()
+    db.executemany(
+        'INSERT INTO calendar_events (task_id, slot, event_id, event_date) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT (task_id, slot) DO UPDATE SET event_id = excluded.event_id, event_date = excluded.event_date',
+        [(task_id, slot, event_id, get_db_date(event_date) if isinstance(event_date, date) else event_date)
+         for task_id, slot, event_id, event_date in events]
+    )
+    commit(db)
+
+def delete_calendar_events(keys):
+    """Stop tracking calendar events, given as (task_id, slot) tuples."""
+    if not keys:
+        return
+    db = get_db()
+    db.executemany('DELETE FROM calendar_events WHERE task_id = ? AND slot = ?', list(keys))
+    commit(db)
+
+def get_stale_calendar_events():
+    """Get tracked calendar events whose task was completed, given up or deleted."""
+    db = get_db()
+    cursor = db.execute('''
+        SELECT e.task_id, e.slot, e.event_id, e.event_date
+        FROM calendar_events e
+        LEFT JOIN tasks t ON t.id = e.task_id
+        WHERE t.id IS NULL OR t.completed = 1 OR t.give_up = 1
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
 # --- Habits Functions ---
 
 def get_habits(db=None):
@@ -485,54 +1474,76 @@ def insert_habit(description, created_date, periodicity):
         'INSERT INTO habits (description, created_date, periodicity) VALUES (?, ?, ?)',
         (description, created_date, periodicity)
     )
-    db.commit()
+    commit(db)
+    invalidate_cache('habits')
     return True
 
-def calculate_last_expected_habit_due_date(last_completion_date, periodicity):
-    today = date.today()
-    if last_completion_date is None:
-        last_expected_date = today
-    else:
-        last_expected_date = parse_date(last_completion_date)
-        if periodicity == 'weekly':
-            while last_expected_date <= today:
-                last_expected_date += timedelta(days=7)
-        elif periodicity == 'biweekly':
-            while last_expected_date <= today:
-                last_expected_date += timedelta(days=14)
-        elif periodicity == 'monthly':
-            while last_expected_date <= today:
-                last_expected_date += timedelta(days=30)
-        elif periodicity == 'quarterly':
-            while last_expected_date <= today:
-                last_expected_date += timedelta(days=90)
-        elif periodicity == 'yearly':
-            while last_expected_date <= today:
-                last_expected_date += timedelta(days=365)
-    return last_expected_date
+# Length of each habit periodicity in days
+PERIODICITY_DAYS = {
+    'weekly': 7,
+    'biweekly': 14,
+    'monthly': 30,
+    'quarterly': 90,
+    'yearly': 365,
+}
 
-def get_habits_without_tasks():
-    db = get_db()
-    habits_without_tasks = []
+def calculate_last_expected_habit_due_date(last_completion_date, periodicity, today=None):
+    """
+    Return the first date after today that is a whole number of periods after last_completion_date
+    (today if the habit was never completed). A last completion in the future is returned as is,
+    and so is any date with an unknown periodicity.
+    today can be passed to evaluate the schedule against another date.
+    """
+    if today is None:
+        today = date.today()
+    last_expected_date = parse_date(last_completion_date)
+    if last_expected_date is None:
+        return today
+    period = PERIODICITY_DAYS.get(periodicity)
+    if period is None or last_expected_date > today:
+        return last_expected_date
+    periods = (today - last_expected_date).days // period + 1
+    return last_expected_date + timedelta(days=periods * period)
+
+def calculate_habit_due_dates(habits, today=None):
+    """
+    Batched calculate_last_expected_habit_due_date for habit dicts with
+    'last_completion_date' and 'periodicity'. Returns the due dates in the same order.
+    """
+    if today is None:
+        today = date.today()
+    return [
+        calculate_last_expected_habit_due_date(habit['last_completion_date'], habit['periodicity'], today)
+        for habit in habits
+    ]
 
-    # Get all habits
-    habits = get_habits()
+HABIT_STATES_SQL = '''
+    SELECT habits.id, habits.description, habits.created_date, habits.periodicity,
+           COALESCE(s.active_tasks, 0) AS active_tasks, s.last_completion_date
+    FROM habits
+    LEFT JOIN (
+        SELECT habit_id,
+               SUM(completed = 0) AS active_tasks,
+               MAX(CASE WHEN completed = 1 THEN completion_date END) AS last_completion_date
+        FROM tasks
+        WHERE habit_id IS NOT NULL
+        GROUP BY habit_id
+    ) s ON s.habit_id = habits.id
+    ORDER BY habits.id DESC
+'''
 
-    for habit in habits:
-        habit_id = habit['id']
-        periodicity = habit['periodicity']
-        
-        # Check for active tasks for this habit
-        cursor = db.execute('SELECT COUNT(*) FROM tasks WHERE habit_id = ? AND completed = 0', (habit_id,))
-        active_tasks_count = cursor.fetchone()[0]
-
-        if active_tasks_count == 0:
-            # Check date of last completed task for this habit
-            cursor = db.execute('SELECT MAX(completion_date) FROM tasks WHERE habit_id = ? AND completed = 1', (habit_id,))
-            last_completion_date = cursor.fetchone()[0]
-            
-            due_date_for_task = calculate_last_expected_habit_due_date(last_completion_date, periodicity)
-            habit['due_date_for_task'] = due_date_for_task
-            habits_without_tasks.append(habit)
-    
-    return habits_without_tasks
\ No newline at end of file
+def get_habit_states():
+    """
+    Get all habits with their number of active (incomplete) tasks and the date of their last completed task,
+    in one grouped query over idx_tasks_habit.
+    """
+    db = get_db()
+    cursor = db.execute(HABIT_STATES_SQL)
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_habits_without_tasks():
+    habits_without_tasks = [habit for habit in get_habit_states() if habit['active_tasks'] == 0]
+    due_dates = calculate_habit_due_dates(habits_without_tasks)
+    for habit, due_date_for_task in zip(habits_without_tasks, due_dates):
+        habit['due_date_for_task'] = due_date_for_task
+    return habits_without_tasks
@@ -4,8 +4,13 @@ import pickle
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 from datetime import timedelta
 import logging
+from db import get_calendar_events, save_calendar_events, delete_calendar_events, get_stale_calendar_events, get_db_date
+from outbound import OutboundPolicy, CircuitOpenError, READ_TIMEOUT
 
 # Configure logging
 logging.basicConfig(
@@ -17,14 +22,25 @@ logging.basicConfig(
 
 # Define the scopes
 SCOPES = ['https://www.googleapis.com/auth/calendar.events.owned']
+TOKEN_FILE = 'token.pickle'
+BATCH_SIZE = 50  # Maximum number of calls in one Calendar API batch request
+CALENDAR_TIMEOUT = 2 * READ_TIMEOUT  # Socket timeout in seconds; a batch of BATCH_SIZE calls answers slower than a single call
+
+calendar_policy = OutboundPolicy('calendar', timeout=CALENDAR_TIMEOUT)
+
+# Authenticated service, built once per process (see get_calendar_service)
+_service = None
+_credentials = None
 
 def authenticate_calendar(credentials_file='credentials.json'):
     """
     Authenticate to Google Calendar API using JSON credentials file.
     Automatically handles token expiration and renewal.
+    Builds a new service on every call, most callers should use get_calendar_service() instead.
     """
+    global _credentials
     creds = None
-    token_file = 'token.pickle'
+    token_file = TOKEN_FILE
     
     # Check if token.pickle exists (stores access tokens)
     if os.path.exists(token_file):
@@ -74,27 +90,64 @@ def authenticate_calendar(credentials_file='credentials.json'):
             return None
     
     try:
-        return build('calendar', 'v3', credentials=creds)
+        # httplib2 waits forever by default, so the service gets an Http with a timeout
+        service = build('calendar', 'v3', http=AuthorizedHttp(creds, http=httplib2.Http(timeout=CALENDAR_TIMEOUT)))
+        _credentials = creds
+        return service
     except Exception as e:
         print(f"Failed to create calendar service: {str(e)}")
         if os.path.exists(token_file):
             os.remove(token_file)
         return None
 
-def create_event(task: dict, start_time: datetime.datetime, duration: int = 30) -> dict:
+def get_calendar_service():
     """
-    Create a new event in the primary calendar.
-    
-    Args:
-        task (dict): The task to create an event for.
-        start_time (datetime.datetime): The start time of the event.
-        duration (int, optional): The duration of the event in minutes. Defaults to 30.
-    
-    Returns:
-        dict: The created event.
+    Return the process-wide Calendar service, building it on first use.
+    The token is only refreshed (and token.pickle rewritten) when it has actually expired.
+    """
+    global _service
+    if _service is not None and _credentials is not None and _credentials.expired:
+        if _credentials.refresh_token:
+            try:
+                _credentials.refresh(Request())
+                with open(TOKEN_FILE, 'wb') as token:
+                    pickle.dump(_credentials, token)
+            except Exception as e:
+                print(f"Token refresh failed: {str(e)}")
+                _service = None
+        else:
+            _service = None
+    if _service is None:
+        _service = authenticate_calendar()
+    return _service
+
+def is_transient_error(error):
+    """Whether a Calendar API error is worth retrying: network errors, timeouts, rate limiting and server errors."""
+    if isinstance(error, HttpError):
+        return error.resp.status in (429, 500, 502, 503, 504)
+    return isinstance(error, (OSError, httplib2.HttpLib2Error))
+
+def execute_batches(service, requests, callback, idempotent=True):
+    """
+    Send (request_id, request) pairs in batches of BATCH_SIZE through calendar_policy.
+    A batch that fails is logged and its callbacks are not called; once the circuit opens
+    the remaining batches are skipped.
     """
-    service = authenticate_calendar()
-    event = {
+    for offset in range(0, len(requests), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, request in requests[offset:offset + BATCH_SIZE]:
+            batch.add(request, request_id=request_id)
+        try:
+            calendar_policy.call(batch.execute, is_transient=is_transient_error, idempotent=idempotent)
+        except CircuitOpenError as e:
+            logging.error(f"Skipping {len(requests) - offset} calendar call(s): {e}")
+            return
+        except Exception as e:
+            logging.error(f"Calendar batch request failed: {e}")
+
+def build_event(task: dict, start_time: datetime.datetime, duration: int = 30) -> dict:
+    """Build the Calendar event body for a task."""
+    return {
         'summary': f'Task: {task["description"]}',
         'description': f'Next Action: {task["next_action"]}',
         'start': {
@@ -110,6 +163,118 @@ def create_event(task: dict, start_time: datetime.datetime, duration: int = 30)
         },
     }
 
-    event = service.events().insert(calendarId='primary', body=event).execute()
-    logging.info(f"Successfully created event for task {task['id']} - {task['description']}")
-    return event
\ No newline at end of file
+def get_event_slot(start_time: datetime.datetime) -> str:
+    """Return the slot key under which an event at start_time is tracked."""
+    return start_time.strftime('%H:%M')
+
+def create_event(task: dict, start_time: datetime.datetime, duration: int = 30) -> dict:
+    """
+    Create a new event in the primary calendar, or move the task's existing event for this slot to start_time.
+    If the task already has an event for this slot on start_time's date, nothing is sent.
+    
+    Args:
+        task (dict): The task to create an event for.
+        start_time (datetime.datetime): The start time of the event.
+        duration (int, optional): The duration of the event in minutes. Defaults to 30.
+    
+    Returns:
+        dict: The created event.
+    """
+    return create_events([task], [start_time], duration)[(task['id'], start_time)]
+
+def create_events(tasks: list, start_times: list, duration: int = 30) -> dict:
+    """
+    Make sure every task has an event at every start time, using batch requests
+    (up to BATCH_SIZE calls per HTTP round trip).
+    Events are tracked in the calendar_events table per task and slot: an event already
+    scheduled for that date is skipped, one from an earlier date is moved (updated) to start_time,
+    and a new event is only inserted when the task has none for the slot.
+    
+    Args:
+        tasks (list): The tasks to create events for.
+        start_times (list): The start times (datetime.datetime) of the events for each task.
+        duration (int, optional): The duration of the events in minutes. Defaults to 30.
+    
+    Returns:
+        dict: (task id, start time) -> the created, updated or already existing event, or None if it failed.
+    """
+    service = get_calendar_service()
+    calls = [(task, start_time) for task in tasks for start_time in start_times]
+    results = {(task['id'], start_time): None for task, start_time in calls}
+    if service is None:
+        return results
+
+    tracked = get_calendar_events({task['id'] for task in tasks})
+    pending = []
+    for task, start_time in calls:
+        existing = tracked.get((task['id'], get_event_slot(start_time)))
+        if existing and existing['event_date'] == get_db_date(start_time.date()):
+            results[(task['id'], start_time)] = {'id': existing['event_id']}
+            continue
+        body = build_event(task, start_time, duration)
+        if existing:
+            request = service.events().update(calendarId='primary', eventId=existing['event_id'], body=body)
+        else:
+            request = service.events().insert(calendarId='primary', body=body)
+        pending.append((task, start_time, existing is not None, request))
+
+    saved = []
+    lost = []
+
+    def callback(request_id, response, exception):
+        task, start_time, is_update, _ = pending[int(request_id)]
+        slot = get_event_slot(start_time)
+        if exception is not None:
+            logging.error(f"Failed to {'update' if is_update else 'create'} event for task {task['id']} - {task['description']}: {exception}")
+            if is_update:
+                # The tracked event may have been deleted from the calendar, insert a new one next run
+                lost.append((task['id'], slot))
+        else:
+            logging.info(f"Successfully {'updated' if is_update else 'created'} event for task {task['id']} - {task['description']}")
+            results[(task['id'], start_time)] = response
+            saved.append((task['id'], slot, response['id'], start_time.date()))
+
+    # Inserts are not retried: if a failed batch actually went through, a retry would duplicate events
+    execute_batches(service, [(str(i), request) for i, (_, _, _, request) in enumerate(pending)], callback,
+                    idempotent=all(is_update for _, _, is_update, _ in pending))
+
+    save_calendar_events(saved)
+    delete_calendar_events(lost)
+    return results
+
+def delete_stale_events() -> int:
+    """
+    Delete the calendar events of tasks that were completed, given up or deleted.
+    Events from earlier days are kept in the calendar and only stop being tracked.
+    
+    Returns:
+        int: The number of events deleted from the calendar.
+    """
+    stale = get_stale_calendar_events()
+    if not stale:
+        return 0
+    today = get_db_date()
+    upcoming = [event for event in stale if event['event_date'] >= today]
+    deleted = []
+
+    service = get_calendar_service() if upcoming else None
+    if upcoming and service is None:
+        return 0
+
+    def callback(request_id, response, exception):
+        event = upcoming[int(request_id)]
+        # 404/410 mean the event is already gone
+        if exception is None or getattr(getattr(exception, 'resp', None), 'status', None) in (404, 410):
+            deleted.append(event)
+        else:
+            logging.error(f"Failed to delete event {event['event_id']} for task {event['task_id']}: {exception}")
+
+    execute_batches(service, [(str(i), service.events().delete(calendarId='primary', eventId=event['event_id']))
+                              for i, event in enumerate(upcoming)], callback)
+
+    deleted_ids = {(event['task_id'], event['slot']) for event in deleted}
+    untracked = [(event['task_id'], event['slot']) for event in stale
+                 if event['event_date'] < today or (event['task_id'], event['slot']) in deleted_ids]
+    delete_calendar_events(untracked)
+    logging.info(f"Deleted {len(deleted)} calendar event(s) for finished tasks")
+    return len(deleted)
@@ -1,33 +1,42 @@
-from notifications import send_notification
-from events import create_event
-from db import get_habits_without_tasks, get_overdue_tasks, insert_task
+from notifications import queue_notifications, queue_digest, deliver_outbox, get_session, ntfy_policy
+from events import create_events, delete_stale_events, get_calendar_service, calendar_policy
+from db import (get_db, get_habits_without_tasks, get_overdue_tasks, insert_tasks, get_earliest_open_due_date,
+                get_unnotified_overdue_task_ids, get_next_outbox_attempt, get_stale_calendar_events)
+import argparse
 import datetime
+import heapq
+import os
+import time
+
+POLL_INTERVAL = 5  # Seconds between data version checks while the daemon waits
+NOTIFY_HOUR = float(os.environ.get('MELGA_NOTIFY_HOUR', 9))  # Local time of the daemon's daily run (9.5 is 09:30)
 
 def get_event_time(hour: float):
     hour_int = int(hour)
     minute = int((hour - hour_int) * 60)
     today = datetime.datetime.now()
     return datetime.datetime(
-        today.year, 
-        today.month, 
-        today.day, 
+        today.year,
+        today.month,
+        today.day,
         hour_int, minute, 0
-    )   
+    )
 
-def main():
+def run_once(digest=False):
     """
     Create tasks for overdue habits.
     Run the notifications and create events for overdue tasks.
+    With digest=True, overdue tasks not yet notified today are sent as a single message.
     """
-    tasks_created = 0
+    # Each run gets a fresh retry budget for the external services
+    ntfy_policy.reset_budget()
+    calendar_policy.reset_budget()
+
     habits_without_tasks = get_habits_without_tasks()
-    for habit in habits_without_tasks:
-        insert_task(
-            description = habit['description'],
-            due_date = habit['due_date_for_task'],
-            habit_id = habit['id']
-            )
-        tasks_created += 1
+    tasks_created = insert_tasks(
+        {'description': habit['description'], 'due_date': habit['due_date_for_task'], 'habit_id': habit['id']}
+        for habit in habits_without_tasks
+    )
 
     overdue_tasks = get_overdue_tasks()
     has_priority_tasks = any(task['priority'] for task in overdue_tasks)
@@ -35,28 +44,145 @@ def main():
     event_time_1 = get_event_time(13)
     event_time_2 = get_event_time(18)
 
-    notifications_sent = 0
+    # Shares the outbox with the web app, so this also retries notifications queued there
+    if digest:
+        queue_digest(get_overdue_tasks(unnotified=True))
+    else:
+        queue_notifications(overdue_tasks)
+    notifications_sent = deliver_outbox()['sent']
+
+    event_tasks = [task for task in overdue_tasks if (not has_priority_tasks) or task['priority']]
+    events = create_events(event_tasks, [event_time_1, event_time_2]) if event_tasks else {}
+
     events_created = 0
-    for task in overdue_tasks:
-        status = send_notification(task)
-        if status == 200:
-            notifications_sent += 1
-    
-        if (not has_priority_tasks) or task['priority']:
-            event_1 = create_event(task, event_time_1)
-            event_2 = create_event(task, event_time_2)
-
-            if event_1 and event_2:
-                events_created += 1
-            else:
-                if not event_1:
-                    print(f"Failed to create event for task {task['id']} at {event_time_1}")
-                if not event_2:
-                    print(f"Failed to create event for task {task['id']} at {event_time_2}")
-        
+    for task in event_tasks:
+        event_1 = events.get((task['id'], event_time_1))
+        event_2 = events.get((task['id'], event_time_2))
+
+        if event_1 and event_2:
+            events_created += 1
+        else:
+            if not event_1:
+                print(f"Failed to create event for task {task['id']} at {event_time_1}")
+            if not event_2:
+                print(f"Failed to create event for task {task['id']} at {event_time_2}")
+
 
     print(f"Successfully created {tasks_created} task(s) for habits without tasks.")
     print(f"Successfully sent {notifications_sent} notification(s) for overdue tasks out of {len(overdue_tasks)} tasks.")
+    events_deleted = delete_stale_events()
+
     print(f"Successfully created {events_created} event(s) for overdue tasks out of {len(overdue_tasks)} tasks.")
+    print(f"Deleted {events_deleted} event(s) for finished tasks.")
+
+# --- Daemon ---
+
+def get_notify_time(day, notify_hour=NOTIFY_HOUR):
+    hour = int(notify_hour)
+    minute = int((notify_hour - hour) * 60)
+    return datetime.datetime.combine(day, datetime.time(hour, minute)).timestamp()
+
+def load_schedule(notify_hour=NOTIFY_HOUR):
+    """
+    Build the priority queue of upcoming (time, job) wake-ups from two indexed lookups:
+    a full run at notify_hour on the first day a task is overdue (the next notify time if some
+    already are, since overdue tasks are notified daily) and an outbox delivery when the next retry is due.
+    """
+    schedule = []
+    today = datetime.date.today()
+    earliest_due_date = get_earliest_open_due_date()
+    run_day = max(earliest_due_date + datetime.timedelta(days=1), today) if earliest_due_date else today
+    if get_notify_time(run_day, notify_hour) <= time.time():
+        run_day += datetime.timedelta(days=1)
+    heapq.heappush(schedule, (get_notify_time(run_day, notify_hour), 'run'))
+    next_attempt = get_next_outbox_attempt()
+    if next_attempt is not None:
+        # At least a second away, so a delivery that keeps failing to claim cannot spin
+        heapq.heappush(schedule, (max(next_attempt, time.time() + 1), 'deliver'))
+    return schedule
+
+def get_pending_work():
+    """
+    Keys of the work a full run would do, from cheap checks only: overdue tasks not notified today,
+    habits without tasks and calendar events of finished tasks.
+    """
+    return (
+        {('notify', task_id) for task_id in get_unnotified_overdue_task_ids()}
+        | {('habit', habit['id']) for habit in get_habits_without_tasks()}
+        | {('event', event['task_id'], event['slot']) for event in get_stale_calendar_events()}
+    )
+
+def needs_run(left_over):
+    """
+    Whether a change made elsewhere left new work for a full run. Work the last run left undone
+    (a failed notification, an unreachable calendar) is in left_over and waits for the next scheduled run.
+    """
+    return bool(get_pending_work() - left_over)
+
+def get_data_version():
+    # Changes whenever another connection commits; reads no table
+    return get_db().execute('PRAGMA data_version').fetchone()[0]
+
+def run_job(job, digest=False):
+    try:
+        if job == 'run':
+            run_once(digest)
+        else:
+            deliver_outbox()
+    except Exception as e:
+        print(f"{job} failed: {e}")
+
+def run_daemon(poll_interval=POLL_INTERVAL, digest=False, notify_hour=NOTIFY_HOUR):
+    """
+    Keep running with warm API clients and database connection, sleeping until the next
+    scheduled wake-up and waking early only when another process changes the database
+    in a way that leaves new work.
+    """
+    get_session()
+    try:
+        get_calendar_service()
+    except Exception as e:
+        print(f"Calendar unavailable, events will be retried on the next run: {e}")
+
+    run_job('run', digest)
+    left_over = get_pending_work()
+    schedule = load_schedule(notify_hour)
+    data_version = get_data_version()
+    while True:
+        now = time.time()
+        if schedule[0][0] <= now:
+            _, job = heapq.heappop(schedule)
+            run_job(job, digest)
+            if job == 'run':
+                left_over = get_pending_work()
+            schedule = load_schedule(notify_hour)
+            continue
+
+        time.sleep(min(poll_interval, schedule[0][0] - now))
+        current_version = get_data_version()
+        if current_version != data_version:
+            data_version = current_version
+            if needs_run(left_over):
+                run_job('run', digest)
+                left_over = get_pending_work()
+            schedule = load_schedule(notify_hour)
+
+def main():
+    parser = argparse.ArgumentParser(description='Create habit tasks, send notifications and create events for overdue tasks.')
+    parser.add_argument('--daemon', action='store_true', help='keep running and act as soon as work is due')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL,
+                        help='seconds between database change checks in daemon mode')
+    parser.add_argument('--digest', action='store_true', help='send one message listing all overdue tasks instead of one per task')
+    parser.add_argument('--notify-hour', type=float, default=NOTIFY_HOUR,
+                        help='local time of the daily run in daemon mode, e.g. 9.5 for 09:30 (default: MELGA_NOTIFY_HOUR or 9)')
+    args = parser.parse_args()
+    if args.daemon:
+        try:
+            run_daemon(args.poll_interval, args.digest, args.notify_hour)
+        except KeyboardInterrupt:
+            pass
+    else:
+        run_once(args.digest)
+
 if __name__ == "__main__":
     exit(main())
@@ -0,0 +1,113 @@
+"""
+Per-request latency, SQL and template instrumentation, exported in Prometheus text format.
+Metrics are kept in memory per process; with several gunicorn workers each one reports its own.
+"""
+import os
+import threading
+import time
+
+import jinja2
+from flask import g, request
+
+import db
+
+# Set MELGA_SERVER_TIMING=1 to add a Server-Timing header (shown in the browser devtools) to every response
+SERVER_TIMING = os.environ.get('MELGA_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per endpoint."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}  # endpoint -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {endpoint: list(values) for endpoint, values in self._series.items()}
+        for endpoint, values in sorted(series.items()):
+            label = f'endpoint="{endpoint}"'
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-2]}')
+            lines.append(f'{self.name}_sum{{{label}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{label}}} {values[-2]}')
+        return lines
+
+request_duration = Histogram('melga_request_duration_seconds', 'Time spent handling a request.', DURATION_BUCKETS)
+request_queries = Histogram('melga_request_sql_queries', 'SQL statements executed per request.', QUERY_BUCKETS)
+request_sql_duration = Histogram('melga_request_sql_duration_seconds', 'Time spent in SQLite per request.', DURATION_BUCKETS)
+request_render_duration = Histogram('melga_request_render_duration_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS)
+
+HISTOGRAMS = (request_duration, request_queries, request_sql_duration, request_render_duration)
+
+class TimedTemplate(jinja2.Template):
+    """Template that adds its render time to the current request."""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            g._render_seconds = g.get('_render_seconds', 0.0) + time.perf_counter() - start
+
+def start_request():
+    g._request_start = time.perf_counter()
+    g._render_seconds = 0.0
+    db.reset_query_stats()
+
+def finish_request(response):
+    """Record the request in the histograms and, if enabled, add the Server-Timing header."""
+    if '_request_start' not in g:
+        return response
+    total = time.perf_counter() - g._request_start
+    stats = db.get_query_stats()
+    render = g.get('_render_seconds', 0.0)
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe(endpoint, total)
+    request_queries.observe(endpoint, stats.queries)
+    request_sql_duration.observe(endpoint, stats.seconds)
+    request_render_duration.observe(endpoint, render)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = (
+            f'sql;desc="{stats.queries} queries";dur={stats.seconds * 1000:.2f}, '
+            f'render;dur={render * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+    return response
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    cache_stats = db.get_cache_stats()
+    for name in ('hits', 'misses', 'evictions'):
+        lines.append(f'# TYPE melga_query_cache_{name}_total counter')
+        lines.append(f'melga_query_cache_{name}_total {cache_stats[name]}')
+    lines.append('# TYPE melga_query_cache_entries gauge')
+    lines.append(f'melga_query_cache_entries {cache_stats["entries"]}')
+    return '\n'.join(lines) + '\n'
+
+def init_app(app):
+    """Install the request hooks and the timed template class on a Flask app."""
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(start_request)
+    app.after_request(finish_request)
@@ -1,11 +1,4 @@
-DROP TABLE IF EXISTS tasks;
-DROP TABLE IF EXISTS task_actions;
-DROP TABLE IF EXISTS goals;
-DROP TABLE IF EXISTS notes;
-DROP TABLE IF EXISTS random_things_to_do;
-DROP TABLE IF EXISTS habits;
-
-CREATE TABLE goals (
+CREATE TABLE IF NOT EXISTS goals (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         description TEXT NOT NULL,
         created_date DATE NOT NULL,
@@ -14,14 +7,14 @@ CREATE TABLE goals (
         completion_date DATE
 );
 
-CREATE TABLE habits (
+CREATE TABLE IF NOT EXISTS habits (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     description TEXT NOT NULL,
     created_date DATE NOT NULL,
     periodicity TEXT NOT NULL -- e.g., 'weekly', 'biweekly', 'monthly', 'quarterly', 'yearly'
 );
 
-CREATE TABLE tasks (
+CREATE TABLE IF NOT EXISTS tasks (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     description TEXT NOT NULL,
     due_date DATE NOT NULL,
@@ -38,7 +31,7 @@ CREATE TABLE tasks (
     FOREIGN KEY (habit_id) REFERENCES habits(id)
 );
 
-CREATE TABLE task_actions (
+CREATE TABLE IF NOT EXISTS task_actions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     task_id INTEGER NOT NULL,
     action_description TEXT NOT NULL,
@@ -46,7 +39,7 @@ CREATE TABLE task_actions (
     FOREIGN KEY (task_id) REFERENCES tasks(id)
 );
 
-CREATE TABLE notes (
+CREATE TABLE IF NOT EXISTS notes (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     title TEXT NOT NULL,
     note TEXT NOT NULL,
@@ -54,10 +47,10 @@ CREATE TABLE notes (
     created_date DATE NOT NULL
 );
 
-CREATE TABLE random_things_to_do (
+CREATE TABLE IF NOT EXISTS random_things_to_do (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     description TEXT NOT NULL,
     completed BOOLEAN NOT NULL DEFAULT 0, -- 0 for false, 1 for true
     completion_date DATE,
     link TEXT
-);
\ No newline at end of file
+);
@@ -0,0 +1,21 @@
+-- Indexes for the hot read paths in db.py
+
+-- get_tasks / get_overdue_tasks: ordered and filtered by due date
+CREATE INDEX IF NOT EXISTS idx_tasks_completed_due_date ON tasks (completed, due_date);
+CREATE INDEX IF NOT EXISTS idx_tasks_give_up_due_date ON tasks (give_up, due_date);
+
+-- get_priority_task
+CREATE INDEX IF NOT EXISTS idx_tasks_priority_due_date ON tasks (completed, priority, due_date);
+
+-- get_habits_without_tasks / get_tasks_by_habit
+CREATE INDEX IF NOT EXISTS idx_tasks_habit ON tasks (habit_id, completed, completion_date);
+
+-- get_activity_data
+CREATE INDEX IF NOT EXISTS idx_tasks_completion_date ON tasks (completed, completion_date);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_date ON tasks (created_date);
+CREATE INDEX IF NOT EXISTS idx_task_actions_action_date ON task_actions (action_date);
+CREATE INDEX IF NOT EXISTS idx_notes_created_date ON notes (created_date);
+CREATE INDEX IF NOT EXISTS idx_goals_completion_date ON goals (completed, completion_date);
+
+-- get_actions
+CREATE INDEX IF NOT EXISTS idx_task_actions_task_date ON task_actions (task_id, action_date);
@@ -0,0 +1,3 @@
+-- get_tasks: open tasks (completion_date IS NULL) and tasks completed today are
+-- both range lookups on this index, independent of the number of old completed tasks
+CREATE INDEX IF NOT EXISTS idx_tasks_open ON tasks (give_up, completion_date, due_date);
@@ -0,0 +1,123 @@
+-- Per-day activity rollup for the activity graph, kept current by triggers
+CREATE TABLE IF NOT EXISTS daily_activity (
+    day DATE PRIMARY KEY,
+    actions INTEGER NOT NULL DEFAULT 0,
+    notes INTEGER NOT NULL DEFAULT 0,
+    tasks_created INTEGER NOT NULL DEFAULT 0,
+    task_completions INTEGER NOT NULL DEFAULT 0,
+    goal_completions INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- task_actions -> actions
+CREATE TRIGGER IF NOT EXISTS daily_activity_action_insert AFTER INSERT ON task_actions
+BEGIN
+    INSERT INTO daily_activity (day, actions) VALUES (NEW.action_date, 1)
+        ON CONFLICT (day) DO UPDATE SET actions = actions + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_action_delete AFTER DELETE ON task_actions
+BEGIN
+    UPDATE daily_activity SET actions = actions - 1 WHERE day = OLD.action_date;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_action_update AFTER UPDATE OF action_date ON task_actions
+BEGIN
+    UPDATE daily_activity SET actions = actions - 1 WHERE day = OLD.action_date;
+    INSERT INTO daily_activity (day, actions) VALUES (NEW.action_date, 1)
+        ON CONFLICT (day) DO UPDATE SET actions = actions + 1;
+END;
+
+-- notes -> notes
+CREATE TRIGGER IF NOT EXISTS daily_activity_note_insert AFTER INSERT ON notes
+BEGIN
+    INSERT INTO daily_activity (day, notes) VALUES (NEW.created_date, 1)
+        ON CONFLICT (day) DO UPDATE SET notes = notes + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_note_delete AFTER DELETE ON notes
+BEGIN
+    UPDATE daily_activity SET notes = notes - 1 WHERE day = OLD.created_date;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_note_update AFTER UPDATE OF created_date ON notes
+BEGIN
+    UPDATE daily_activity SET notes = notes - 1 WHERE day = OLD.created_date;
+    INSERT INTO daily_activity (day, notes) VALUES (NEW.created_date, 1)
+        ON CONFLICT (day) DO UPDATE SET notes = notes + 1;
+END;
+
+-- tasks -> tasks_created, task_completions
+CREATE TRIGGER IF NOT EXISTS daily_activity_task_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO daily_activity (day, tasks_created) VALUES (NEW.created_date, 1)
+        ON CONFLICT (day) DO UPDATE SET tasks_created = tasks_created + 1;
+    INSERT INTO daily_activity (day, task_completions)
+        SELECT NEW.completion_date, 1 WHERE NEW.completed = 1 AND NEW.completion_date IS NOT NULL
+        ON CONFLICT (day) DO UPDATE SET task_completions = task_completions + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_task_delete AFTER DELETE ON tasks
+BEGIN
+    UPDATE daily_activity SET tasks_created = tasks_created - 1 WHERE day = OLD.created_date;
+    UPDATE daily_activity SET task_completions = task_completions - 1
+        WHERE day = OLD.completion_date AND OLD.completed = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_task_created_update AFTER UPDATE OF created_date ON tasks
+BEGIN
+    UPDATE daily_activity SET tasks_created = tasks_created - 1 WHERE day = OLD.created_date;
+    INSERT INTO daily_activity (day, tasks_created) VALUES (NEW.created_date, 1)
+        ON CONFLICT (day) DO UPDATE SET tasks_created = tasks_created + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_task_completion_update AFTER UPDATE OF completed, completion_date ON tasks
+BEGIN
+    UPDATE daily_activity SET task_completions = task_completions - 1
+        WHERE day = OLD.completion_date AND OLD.completed = 1;
+    INSERT INTO daily_activity (day, task_completions)
+        SELECT NEW.completion_date, 1 WHERE NEW.completed = 1 AND NEW.completion_date IS NOT NULL
+        ON CONFLICT (day) DO UPDATE SET task_completions = task_completions + 1;
+END;
+
+-- goals -> goal_completions
+CREATE TRIGGER IF NOT EXISTS daily_activity_goal_insert AFTER INSERT ON goals
+BEGIN
+    INSERT INTO daily_activity (day, goal_completions)
+        SELECT NEW.completion_date, 1 WHERE NEW.completed = 1 AND NEW.completion_date IS NOT NULL
+        ON CONFLICT (day) DO UPDATE SET goal_completions = goal_completions + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_goal_delete AFTER DELETE ON goals
+BEGIN
+    UPDATE daily_activity SET goal_completions = goal_completions - 1
+        WHERE day = OLD.completion_date AND OLD.completed = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_activity_goal_completion_update AFTER UPDATE OF completed, completion_date ON goals
+BEGIN
+    UPDATE daily_activity SET goal_completions = goal_completions - 1
+        WHERE day = OLD.completion_date AND OLD.completed = 1;
+    INSERT INTO daily_activity (day, goal_completions)
+        SELECT NEW.completion_date, 1 WHERE NEW.completed = 1 AND NEW.completion_date IS NOT NULL
+        ON CONFLICT (day) DO UPDATE SET goal_completions = goal_completions + 1;
+END;
+
+-- Backfill from existing data (same query as db.rebuild_daily_activity)
+DELETE FROM daily_activity;
+INSERT INTO daily_activity (day, actions, notes, tasks_created, task_completions, goal_completions)
+SELECT day, SUM(actions), SUM(notes), SUM(tasks_created), SUM(task_completions), SUM(goal_completions)
+FROM (
+    SELECT action_date AS day, 1 AS actions, 0 AS notes, 0 AS tasks_created, 0 AS task_completions, 0 AS goal_completions FROM task_actions
+    UNION ALL SELECT created_date, 0, 1, 0, 0, 0 FROM notes
+    UNION ALL SELECT created_date, 0, 0, 1, 0, 0 FROM tasks
+    UNION ALL SELECT completion_date, 0, 0, 0, 1, 0 FROM tasks WHERE completed = 1 AND completion_date IS NOT NULL
+    UNION ALL SELECT completion_date, 0, 0, 0, 0, 1 FROM goals WHERE completed = 1 AND completion_date IS NOT NULL
+)
+WHERE day IS NOT NULL
+GROUP BY day;
+
+-- Only the old per-request activity queries used these
+DROP INDEX IF EXISTS idx_tasks_completion_date;
+DROP INDEX IF EXISTS idx_tasks_created_date;
+DROP INDEX IF EXISTS idx_task_actions_action_date;
+DROP INDEX IF EXISTS idx_goals_completion_date;
@@ -0,0 +1,9 @@
+-- Google Calendar events created for tasks, one per task and time slot
+CREATE TABLE IF NOT EXISTS calendar_events (
+    task_id INTEGER NOT NULL,
+    slot TEXT NOT NULL, -- start time of the event, e.g. '13:00'
+    event_id TEXT NOT NULL,
+    event_date DATE NOT NULL,
+    PRIMARY KEY (task_id, slot),
+    FOREIGN KEY (task_id) REFERENCES tasks(id)
+);
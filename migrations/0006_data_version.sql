@@ -0,0 +1,97 @@
+-- Global data version, bumped by triggers on every write to the user-facing tables.
+-- Used to build ETags for conditional GETs (see db.get_data_version)
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS data_version_tasks_insert AFTER INSERT ON tasks
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_tasks_update AFTER UPDATE ON tasks
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_tasks_delete AFTER DELETE ON tasks
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_task_actions_insert AFTER INSERT ON task_actions
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_task_actions_update AFTER UPDATE ON task_actions
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_task_actions_delete AFTER DELETE ON task_actions
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_notes_insert AFTER INSERT ON notes
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_notes_update AFTER UPDATE ON notes
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_notes_delete AFTER DELETE ON notes
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_goals_insert AFTER INSERT ON goals
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_goals_update AFTER UPDATE ON goals
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_goals_delete AFTER DELETE ON goals
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_habits_insert AFTER INSERT ON habits
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_habits_update AFTER UPDATE ON habits
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_habits_delete AFTER DELETE ON habits
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_random_things_to_do_insert AFTER INSERT ON random_things_to_do
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_random_things_to_do_update AFTER UPDATE ON random_things_to_do
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_random_things_to_do_delete AFTER DELETE ON random_things_to_do
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END;
@@ -0,0 +1,2 @@
+-- get_random_thing(only_incomplete=True): id range and probes over incomplete things
+CREATE INDEX IF NOT EXISTS idx_random_things_completed ON random_things_to_do (completed, id);
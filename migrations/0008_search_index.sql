@@ -0,0 +1,78 @@
+-- Full-text search over tasks, task actions and notes, kept in sync by triggers.
+-- rowid = source id * 4 + kind (1 task, 2 action, 3 note), so rows can be replaced by rowid.
+-- target_id is the task id for tasks and actions and the note id for notes.
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED,
+    target_id UNINDEXED,
+    title,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- tasks: description / next_action
+CREATE TRIGGER IF NOT EXISTS search_index_task_insert AFTER INSERT ON tasks
+BEGIN
+    INSERT INTO search_index (rowid, kind, target_id, title, body)
+        VALUES (NEW.id * 4 + 1, 'task', NEW.id, NEW.description, COALESCE(NEW.next_action, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_index_task_update AFTER UPDATE OF description, next_action ON tasks
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+    INSERT INTO search_index (rowid, kind, target_id, title, body)
+        VALUES (NEW.id * 4 + 1, 'task', NEW.id, NEW.description, COALESCE(NEW.next_action, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_index_task_delete AFTER DELETE ON tasks
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+END;
+
+-- task_actions: action_description
+CREATE TRIGGER IF NOT EXISTS search_index_action_insert AFTER INSERT ON task_actions
+BEGIN
+    INSERT INTO search_index (rowid, kind, target_id, title, body)
+        VALUES (NEW.id * 4 + 2, 'action', NEW.task_id, '', NEW.action_description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_index_action_update AFTER UPDATE OF action_description, task_id ON task_actions
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+    INSERT INTO search_index (rowid, kind, target_id, title, body)
+        VALUES (NEW.id * 4 + 2, 'action', NEW.task_id, '', NEW.action_description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_index_action_delete AFTER DELETE ON task_actions
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+END;
+
+-- notes: title / note
+CREATE TRIGGER IF NOT EXISTS search_index_note_insert AFTER INSERT ON notes
+BEGIN
+    INSERT INTO search_index (rowid, kind, target_id, title, body)
+        VALUES (NEW.id * 4 + 3, 'note', NEW.id, NEW.title, NEW.note);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_index_note_update AFTER UPDATE OF title, note ON notes
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+    INSERT INTO search_index (rowid, kind, target_id, title, body)
+        VALUES (NEW.id * 4 + 3, 'note', NEW.id, NEW.title, NEW.note);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_index_note_delete AFTER DELETE ON notes
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+END;
+
+-- Backfill from existing data
+DELETE FROM search_index;
+INSERT INTO search_index (rowid, kind, target_id, title, body)
+    SELECT id * 4 + 1, 'task', id, description, COALESCE(next_action, '') FROM tasks;
+INSERT INTO search_index (rowid, kind, target_id, title, body)
+    SELECT id * 4 + 2, 'action', task_id, '', action_description FROM task_actions;
+INSERT INTO search_index (rowid, kind, target_id, title, body)
+    SELECT id * 4 + 3, 'note', id, title, note FROM notes;
+INSERT INTO search_index (search_index) VALUES ('optimize');
@@ -0,0 +1,2 @@
+-- get_notes(note_type=...): filtered listing in (created_date, id) order
+CREATE INDEX IF NOT EXISTS idx_notes_type_created_date ON notes (type, created_date);
@@ -0,0 +1,22 @@
+-- Notifications waiting to be delivered to ntfy, written by /notify and melgar.py
+-- and delivered (with retries) by the outbox worker
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    headers TEXT NOT NULL, -- JSON object of ntfy headers
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, sending, sent or failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL, -- unix time; for 'sending' rows, when the claim expires
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    FOREIGN KEY (task_id) REFERENCES tasks(id)
+);
+
+-- claim_notifications(): due rows in order
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (status, next_attempt_at);
+
+-- At most one undelivered notification per task
+CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_task_undelivered ON notification_outbox (task_id)
+    WHERE status IN ('pending', 'sending');
@@ -0,0 +1,26 @@
+-- Digest notifications cover several tasks, so notification_outbox.task_id becomes nullable
+-- (NULL for digests). SQLite cannot drop NOT NULL in place, so the table is rebuilt.
+CREATE TABLE notification_outbox_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id INTEGER, -- NULL for a digest
+    message TEXT NOT NULL,
+    headers TEXT NOT NULL, -- JSON object of ntfy headers
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, sending, sent or failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL, -- unix time; for 'sending' rows, when the claim expires
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    FOREIGN KEY (task_id) REFERENCES tasks(id)
+);
+
+INSERT INTO notification_outbox_new
+SELECT id, task_id, message, headers, status, attempts, next_attempt_at, last_error, created_at, sent_at
+FROM notification_outbox;
+
+DROP TABLE notification_outbox;
+ALTER TABLE notification_outbox_new RENAME TO notification_outbox;
+
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (status, next_attempt_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_task_undelivered ON notification_outbox (task_id)
+    WHERE status IN ('pending', 'sending');
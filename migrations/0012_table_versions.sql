@@ -0,0 +1,125 @@
+-- Per-table versions replace the global data_version counter, so the query cache can tell which
+-- cached reads a write affects, including writes from other processes (see db.get_table_versions).
+-- The ETag data version is their sum.
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO table_versions (name, version) VALUES
+    ('tasks', 0),
+    ('task_actions', 0),
+    ('notes', 0),
+    ('goals', 0),
+    ('habits', 0),
+    ('random_things_to_do', 0);
+
+CREATE TRIGGER IF NOT EXISTS table_versions_tasks_insert AFTER INSERT ON tasks
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'tasks';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_tasks_update AFTER UPDATE ON tasks
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'tasks';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_tasks_delete AFTER DELETE ON tasks
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'tasks';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_task_actions_insert AFTER INSERT ON task_actions
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'task_actions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_task_actions_update AFTER UPDATE ON task_actions
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'task_actions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_task_actions_delete AFTER DELETE ON task_actions
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'task_actions';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_notes_insert AFTER INSERT ON notes
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'notes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_notes_update AFTER UPDATE ON notes
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'notes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_notes_delete AFTER DELETE ON notes
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'notes';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_goals_insert AFTER INSERT ON goals
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'goals';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_goals_update AFTER UPDATE ON goals
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'goals';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_goals_delete AFTER DELETE ON goals
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'goals';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_habits_insert AFTER INSERT ON habits
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'habits';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_habits_update AFTER UPDATE ON habits
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'habits';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_habits_delete AFTER DELETE ON habits
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'habits';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_random_things_to_do_insert AFTER INSERT ON random_things_to_do
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'random_things_to_do';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_random_things_to_do_update AFTER UPDATE ON random_things_to_do
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'random_things_to_do';
+END;
+
+CREATE TRIGGER IF NOT EXISTS table_versions_random_things_to_do_delete AFTER DELETE ON random_things_to_do
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE name = 'random_things_to_do';
+END;
+
+DROP TRIGGER IF EXISTS data_version_tasks_insert;
+DROP TRIGGER IF EXISTS data_version_tasks_update;
+DROP TRIGGER IF EXISTS data_version_tasks_delete;
+DROP TRIGGER IF EXISTS data_version_task_actions_insert;
+DROP TRIGGER IF EXISTS data_version_task_actions_update;
+DROP TRIGGER IF EXISTS data_version_task_actions_delete;
+DROP TRIGGER IF EXISTS data_version_notes_insert;
+DROP TRIGGER IF EXISTS data_version_notes_update;
+DROP TRIGGER IF EXISTS data_version_notes_delete;
+DROP TRIGGER IF EXISTS data_version_goals_insert;
+DROP TRIGGER IF EXISTS data_version_goals_update;
+DROP TRIGGER IF EXISTS data_version_goals_delete;
+DROP TRIGGER IF EXISTS data_version_habits_insert;
+DROP TRIGGER IF EXISTS data_version_habits_update;
+DROP TRIGGER IF EXISTS data_version_habits_delete;
+DROP TRIGGER IF EXISTS data_version_random_things_to_do_insert;
+DROP TRIGGER IF EXISTS data_version_random_things_to_do_update;
+DROP TRIGGER IF EXISTS data_version_random_things_to_do_delete;
+DROP TABLE IF EXISTS data_version;
@@ -1,9 +1,16 @@
 import requests
+import urllib3
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from db import set_last_notification
+from requests.adapters import HTTPAdapter
+from db import (enqueue_notifications, enqueue_digest, claim_notifications, complete_notifications, settle_notifications,
+                fail_notifications, postpone_notifications)
 from dotenv import load_dotenv
+from outbound import OutboundPolicy, CircuitOpenError
 
 load_dotenv()
 
@@ -15,23 +22,57 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-def send_notification(task):
-    NTFY_TOPIC = os.getenv('NTFY_TOPIC')
-    NTFY_URL = f"https://ntfy.sh/{NTFY_TOPIC}"
+NTFY_TIMEOUT = (3.05, 10)  # (connect, read) seconds per request
+MAX_WORKERS = 8  # Concurrent requests when dispatching several notifications
+DIGEST_MAX_TASKS = int(os.getenv('NTFY_DIGEST_MAX_TASKS', 15))  # Tasks listed in a digest; the rest are summarized
+DIGEST_MAX_BYTES = 4000  # ntfy turns messages over 4096 bytes into attachments
+OUTBOX_MAX_ATTEMPTS = 6  # Delivery attempts before a notification is marked failed
+OUTBOX_BACKOFF = 30  # Seconds before the first retry, doubled after every failed attempt
+OUTBOX_BATCH_SIZE = 50  # Notifications claimed at a time
+OUTBOX_LEASE = 120  # Seconds a claimed notification is reserved for the worker sending it
+OUTBOX_POLL_INTERVAL = 30  # Seconds between outbox checks when the worker is idle
 
+ntfy_policy = OutboundPolicy('ntfy', timeout=NTFY_TIMEOUT)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the process-wide keep-alive session, so requests to ntfy reuse TLS connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+    return _session
+
+def get_ntfy_url():
+    # NTFY_SERVER allows pointing at a self-hosted (or local test) server
+    ntfy_server = os.getenv('NTFY_SERVER', 'https://ntfy.sh').rstrip('/')
+    return f"{ntfy_server}/{os.getenv('NTFY_TOPIC')}"
+
+def build_notification(task):
+    """
+    Build the ntfy request body and headers for a task.
+    Returns None if a notification was already sent today.
+    """
     # Check if last notification was today
     today = date.today()
 
     if task['last_notification']:
         last_notif_date = datetime.strptime(task['last_notification'], '%Y-%m-%d').date()
         if last_notif_date >= today:
-            return 'Notification already sent.'
+            return None
     
     # Format the due date for display
     try:
         due_date_obj = datetime.strptime(task['due_date'], '%Y-%m-%d').date()
         due_date_display = due_date_obj.strftime('%d/%m/%Y')
     except (ValueError, TypeError):
+        due_date_obj = None
         due_date_display = "Invalid Date"
 
     # Prepare notification content
@@ -41,23 +82,220 @@ def send_notification(task):
     if task['next_action']: # Check if next_action exists and is not empty
         message += f"\nNext Action: {task['next_action']}"
     message += f"\nStatus: {status}"
-    priority = "high" if not task['completed'] and due_date_obj < date.today() else "default"
-    
-    # Send notification to ntfy
-    response = requests.post(
-        NTFY_URL,
-        data=message,
-        headers={
-            "Title": title,
-            "Priority": priority,
-            "Tags": "calendar,phone",
-        }
+    priority = "high" if not task['completed'] and due_date_obj and due_date_obj < today else "default"
+
+    headers = {
+        "Title": title,
+        "Priority": priority,
+        "Tags": "calendar,phone",
+    }
+    return message, headers
+
+def format_digest_line(task):
+    try:
+        due_date_display = datetime.strptime(task['due_date'], '%Y-%m-%d').strftime('%d/%m')
+    except (ValueError, TypeError):
+        due_date_display = "?"
+    line = f"{'! ' if task['priority'] else '- '}{task['description']} (due {due_date_display})"
+    if task['next_action']:
+        line += f" -> {task['next_action']}"
+    return line
+
+def build_digest(tasks, max_tasks=DIGEST_MAX_TASKS):
+    """
+    Build a single ntfy message body and headers listing several overdue tasks,
+    priority tasks first and then by due date. At most max_tasks are listed (and the message
+    is kept under DIGEST_MAX_BYTES); the remaining ones are counted on a final line.
+    Returns None if there are no tasks.
+    """
+    if not tasks:
+        return None
+    tasks = sorted(tasks, key=lambda task: (not task['priority'], task['due_date'], task['id']))
+
+    lines = []
+    size = 0
+    for task in tasks[:max_tasks]:
+        line = format_digest_line(task)
+        size += len(line.encode('utf-8')) + 1
+        if size > DIGEST_MAX_BYTES - 100:  # Leave room for the summary line
+            break
+        lines.append(line)
+    if len(tasks) > len(lines):
+        lines.append(f"...and {len(tasks) - len(lines)} more")
+
+    headers = {
+        "Title": f"{len(tasks)} overdue task{'s' if len(tasks) != 1 else ''}",
+        "Priority": "high" if tasks[0]['priority'] else "default",
+        "Tags": "calendar,phone",
+    }
+    return '\n'.join(lines), headers
+
+def post_notification(task_id, message, headers):
+    """
+    Send a prepared notification to ntfy and return the response status code.
+    Goes through ntfy_policy, so failed connections, 429s and 5xx responses are retried briefly
+    within the retry budget, and CircuitOpenError is raised while ntfy keeps failing.
+    A read timeout is not retried here: ntfy may already have published the message.
+    """
+    response = ntfy_policy.call(
+        get_session().post,
+        get_ntfy_url(),
+        data=message.encode('utf-8'),
+        headers=headers,
+        timeout=ntfy_policy.timeout,
+        is_transient=lambda error: isinstance(error, (requests.ConnectionError, requests.Timeout)),
+        is_failure=lambda response: is_retryable(response.status_code),
+        idempotent=False,
+        is_unsent=is_unsent,
     )
 
+    subject = f"task {task_id}" if task_id is not None else "digest"
     if response.status_code == 200:
-        set_last_notification(task)
-        logging.info(f"Successfully sent notification for task {task['id']} - {task['description']}")
+        logging.info(f"Successfully sent notification for {subject} - {headers['Title']}")
     else:
-        logging.error(f"Failed to send notification for task {task['id']} - {task['description']}. Status code: {response.status_code}")
+        logging.error(f"Failed to send notification for {subject} - {headers['Title']}. Status code: {response.status_code}")
     
-    return response.status_code
\ No newline at end of file
+    return response.status_code
+
+# --- Outbox ---
+
+def queue_notifications(tasks):
+    """
+    Queue notifications for tasks in the outbox; tasks already notified today are skipped.
+    Returns a dict with 'queued' and 'skipped' counts.
+    """
+    pending = []
+    skipped = 0
+    for task in tasks:
+        notification = build_notification(task)
+        if notification is None:
+            skipped += 1
+        else:
+            pending.append((task['id'], *notification))
+    queued = enqueue_notifications(pending)
+    # Tasks that already had a notification waiting count as skipped too
+    return {'queued': queued, 'skipped': skipped + len(pending) - queued}
+
+def queue_notification(task):
+    """Queue a notification for a single task. Returns True if it was queued."""
+    return queue_notifications([task])['queued'] == 1
+
+def queue_digest(tasks, max_tasks=DIGEST_MAX_TASKS):
+    """
+    Queue one digest notification for tasks that were not notified today (see get_overdue_tasks(unnotified=True)).
+    Every task counted in the digest is marked notified, including those only summarized past max_tasks.
+    Returns the number of tasks covered.
+    """
+    digest = build_digest(tasks, max_tasks)
+    if digest is None:
+        return 0
+    enqueue_digest([task['id'] for task in tasks], *digest)
+    return len(tasks)
+
+def get_retry_time(attempts, now=None):
+    """Unix time of the next attempt after `attempts` failed ones, or None once OUTBOX_MAX_ATTEMPTS is reached."""
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        return None
+    return (now or time.time()) + OUTBOX_BACKOFF * 2 ** (attempts - 1)
+
+def is_unsent(failure):
+    """
+    Whether a failed ntfy request certainly did not publish the notification, so retrying it cannot
+    send a duplicate: the connection was never made, or ntfy rejected the request with a 429 or 5xx.
+    """
+    if isinstance(failure, requests.Response):
+        return is_retryable(failure.status_code)
+    if isinstance(failure, requests.ConnectTimeout):
+        return True
+    # Refused connections and failed DNS lookups; a connection dropped mid-request may have been processed
+    reason = getattr(failure.args[0], 'reason', None) if failure.args else None
+    return isinstance(failure, requests.ConnectionError) and isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+def is_retryable(status):
+    """Rate limiting and server errors are retried; other responses are final."""
+    return status == 429 or status >= 500
+
+def deliver_outbox(max_workers=MAX_WORKERS):
+    """
+    Deliver every due notification in the outbox, several at a time over the shared session.
+    Failures that ntfy cannot have published are retried later with exponential backoff
+    (see get_retry_time); a request that failed after ntfy may have accepted it is marked
+    'uncertain' rather than sent twice, and notifications refused by the open circuit are
+    postponed without counting the attempt.
+    Returns a dict with 'sent', 'retrying', 'failed', 'uncertain' and 'postponed' counts.
+    """
+    results = {'sent': 0, 'retrying': 0, 'failed': 0, 'uncertain': 0, 'postponed': 0}
+
+    def dispatch(item):
+        try:
+            return post_notification(item['task_id'], item['message'], item['headers'])
+        except (requests.RequestException, CircuitOpenError) as e:
+            logging.error(f"Failed to send notification {item['id']} (task {item['task_id']}). Error: {e}")
+            return e
+
+    while True:
+        if ntfy_policy.breaker.is_open():
+            # Leave the notifications pending (and their attempts untouched) until ntfy recovers
+            logging.info('ntfy circuit open, postponing outbox delivery')
+            break
+        claimed = claim_notifications(OUTBOX_BATCH_SIZE, OUTBOX_LEASE)
+        if not claimed:
+            break
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(claimed))) as executor:
+            outcomes = list(executor.map(dispatch, claimed))
+
+        sent_ids = []
+        uncertain = []
+        failures = []
+        postponed_ids = []
+        for item, outcome in zip(claimed, outcomes):
+            if outcome == 200:
+                sent_ids.append(item['id'])
+                results['sent'] += 1
+            elif isinstance(outcome, CircuitOpenError):
+                postponed_ids.append(item['id'])
+                results['postponed'] += 1
+            elif isinstance(outcome, Exception) and not is_unsent(outcome):
+                uncertain.append((item['id'], str(outcome)))
+                results['uncertain'] += 1
+            else:
+                retryable = isinstance(outcome, Exception) or is_retryable(outcome)
+                retry_at = get_retry_time(item['attempts']) if retryable else None
+                failures.append((item['id'], str(outcome), retry_at))
+                results['retrying' if retry_at else 'failed'] += 1
+        complete_notifications(sent_ids)
+        settle_notifications(uncertain, 'uncertain')
+        fail_notifications(failures)
+        postpone_notifications(postponed_ids, time.time() + ntfy_policy.breaker.reset_timeout)
+
+    if any(results.values()):
+        logging.info(f"Delivered outbox: {results['sent']} sent, {results['retrying']} to retry, "
+                     f"{results['failed']} failed, {results['uncertain']} uncertain, {results['postponed']} postponed")
+    return results
+
+def run_outbox_worker(wake=None, poll_interval=OUTBOX_POLL_INTERVAL):
+    """Deliver outbox notifications forever, checking every poll_interval seconds or when `wake` is set."""
+    wake = wake or threading.Event()
+    while True:
+        # Cleared before delivering, so a wake-up that arrives mid-delivery triggers another pass
+        wake.clear()
+        try:
+            deliver_outbox()
+        except Exception:
+            logging.exception('Outbox delivery failed')
+        wake.wait(poll_interval)
+
+_worker = None
+_worker_pid = None
+_worker_wake = threading.Event()
+_worker_lock = threading.Lock()
+
+def wake_outbox_worker():
+    """Start this process's background outbox worker thread if needed, and make it check the outbox now."""
+    global _worker, _worker_pid
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid() or not _worker.is_alive():
+            _worker = threading.Thread(target=run_outbox_worker, args=(_worker_wake,), name='outbox-worker', daemon=True)
+            _worker_pid = os.getpid()
+            _worker.start()
+    _worker_wake.set()
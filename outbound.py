@@ -0,0 +1,174 @@
+"""
+Shared policy for outbound calls to external services (ntfy, Google Calendar):
+timeouts, a retry budget with jittered exponential backoff, and a circuit breaker
+that stops calling a service while it is failing.
+"""
+import logging
+import random
+import threading
+import time
+
+CONNECT_TIMEOUT = 3.05  # Seconds to establish a connection
+READ_TIMEOUT = 10  # Seconds to wait for a response
+MAX_RETRIES = 3  # Retries of a single call, if the retry budget allows
+RETRY_BUDGET = 10  # Retries allowed per run (or per BUDGET_WINDOW seconds in long-running processes)
+BUDGET_WINDOW = 300
+BACKOFF_BASE = 0.5  # Seconds; the backoff before retry n is random between 0 and BACKOFF_BASE * 2**n
+BACKOFF_MAX = 8
+FAILURE_THRESHOLD = 5  # Consecutive failures that open the circuit
+RESET_TIMEOUT = 60  # Seconds the circuit stays open before a trial call is let through
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+class RetryBudget:
+    """
+    Caps the number of retries across all calls to a service, so a failing service cannot
+    multiply the latency of a whole run. Refills completely every `window` seconds, or on reset().
+    """
+
+    def __init__(self, retries=RETRY_BUDGET, window=BUDGET_WINDOW):
+        self.retries = retries
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._remaining = self.retries
+            self._refill_at = time.monotonic() + self.window
+
+    def spend(self):
+        """Take one retry from the budget. Returns False if it is exhausted."""
+        with self._lock:
+            if time.monotonic() >= self._refill_at:
+                self._remaining = self.retries
+                self._refill_at = time.monotonic() + self.window
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. Open (after `threshold` consecutive failures): calls are refused
+    for `reset_timeout` seconds. Half-open: a single trial call decides whether to close or re-open.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, name, threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            log = logging.info if state == self.CLOSED else logging.warning
+            log(f"Circuit for {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    def is_open(self):
+        """Whether calls would currently be refused (without taking the half-open trial slot)."""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def allow(self):
+        """Whether a call may go through now. In half-open state only one trial call is allowed at a time."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+def get_backoff(retry):
+    """Full-jitter exponential backoff, in seconds, before retry number `retry` (starting at 1)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** retry))
+
+class OutboundPolicy:
+    """
+    Calls to one external service go through call(), which applies the circuit breaker,
+    retries transient failures within the shared retry budget, and sleeps with jittered backoff.
+    """
+
+    def __init__(self, name, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES,
+                 budget=None, breaker=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker(name)
+
+    def call(self, func, *args, is_transient=lambda error: True, is_failure=lambda result: False,
+             idempotent=True, is_unsent=lambda failure: False, **kwargs):
+        """
+        Call func(*args, **kwargs) under the policy.
+        is_transient(exception) tells which exceptions are worth retrying (and count against the circuit);
+        is_failure(result) marks a returned result (e.g. a 503 response) as a transient failure.
+        Calls that are not idempotent are only retried after failures that is_unsent(failure) says the
+        service cannot have processed (e.g. a refused connection), since otherwise the first attempt may have gone through.
+        Raises CircuitOpenError without calling func while the circuit is open. After the last
+        attempt, a failing result is returned and a failing exception is raised as usual.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        retry = 0
+        while True:
+            # Every failed attempt counts against the circuit, so a hung service opens it quickly
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # The service answered; a client error says nothing about its health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if not self._retry(retry, idempotent or is_unsent(e), e):
+                    raise
+            else:
+                if not is_failure(result):
+                    self.breaker.record_success()
+                    return result
+                self.breaker.record_failure()
+                if not self._retry(retry, idempotent or is_unsent(result), result):
+                    return result
+            retry += 1
+            time.sleep(get_backoff(retry))
+
+    def _retry(self, retry, retryable, failure):
+        if not retryable or retry >= self.max_retries:
+            return False
+        if not self.breaker.allow():
+            return False
+        if not self.budget.spend():
+            logging.warning(f"Retry budget for {self.name} exhausted, not retrying: {failure}")
+            return False
+        logging.info(f"Retrying {self.name} call after: {failure}")
+        return True
+
+    def reset_budget(self):
+        """Start a new run with a full retry budget."""
+        self.budget.reset()
@@ -0,0 +1,56 @@
+"""
+A local stand-in for external HTTP services (ntfy) that fails on demand.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+class FaultyHandler(BaseHTTPRequestHandler):
+    """
+    Answers according to server.mode: 'ok' (200), 'unavailable' (503) or 'hang' (200 after
+    server.hang_seconds). server.mode can also be a function of the request body returning one of them.
+    """
+
+    def do_GET(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        mode = server.mode(body) if callable(server.mode) else server.mode
+        with server.lock:
+            server.requests += 1
+            server.bodies.append(body)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.hang_seconds if mode == 'hang' else server.delay)
+            self.send_response(503 if mode == 'unavailable' else 200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FaultyHandler)
+    server.daemon_threads = True
+    server.mode = 'ok'
+    server.hang_seconds = 2
+    server.delay = 0  # Seconds every answer takes
+    server.requests = 0
+    server.bodies = []
+    server.active = 0  # Requests being handled right now, and the most at any time
+    server.max_active = 0
+    server.lock = threading.Lock()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,89 @@
+"""
+Simulated-clock sweep of the closed-form habit due dates against the while loop they replaced.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+import db
+
+PERIODICITIES = ('weekly', 'biweekly', 'monthly', 'quarterly', 'yearly', 'daily', None)
+
+def reference_due_date(last_completion_date, periodicity, today):
+    """The original implementation, with date.today() replaced by the simulated today."""
+    if last_completion_date is None:
+        last_expected_date = today
+    else:
+        last_expected_date = db.parse_date(last_completion_date)
+        if periodicity == 'weekly':
+            while last_expected_date <= today:
+                last_expected_date += timedelta(days=7)
+        elif periodicity == 'biweekly':
+            while last_expected_date <= today:
+                last_expected_date += timedelta(days=14)
+        elif periodicity == 'monthly':
+            while last_expected_date <= today:
+                last_expected_date += timedelta(days=30)
+        elif periodicity == 'quarterly':
+            while last_expected_date <= today:
+                last_expected_date += timedelta(days=90)
+        elif periodicity == 'yearly':
+            while last_expected_date <= today:
+                last_expected_date += timedelta(days=365)
+    return last_expected_date
+
+def simulated_days(start, end, step):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=step)
+
+# Completions from three years before to a month after today: every day close to today and
+# around one and two years back, where the period boundaries are, and every 11th day otherwise
+COMPLETION_OFFSETS = sorted(set(range(-3 * 366, 31, 11)) | set(range(-100, 8))
+                            | set(range(-370, -360)) | set(range(-735, -725)))
+
+@pytest.mark.parametrize('periodicity', PERIODICITIES)
+def test_matches_loop_over_years(periodicity):
+    # Four years including a leap day, stepping 5 days so today falls on every weekday and month day
+    for today in simulated_days(date(2022, 11, 3), date(2026, 11, 3), 5):
+        for offset in COMPLETION_OFFSETS:
+            completion = db.get_db_date(today + timedelta(days=offset))
+            expected = reference_due_date(completion, periodicity, today)
+            assert db.calculate_last_expected_habit_due_date(completion, periodicity, today) == expected, \
+                (completion, periodicity, today)
+
+@pytest.mark.parametrize('periodicity', PERIODICITIES)
+def test_never_completed_is_due_today(periodicity):
+    today = date(2024, 2, 29)
+    assert db.calculate_last_expected_habit_due_date(None, periodicity, today) == today
+
+def test_boundaries():
+    today = date(2024, 3, 1)
+    # A due date falling on today moves on a full period, as in the loop
+    assert db.calculate_last_expected_habit_due_date('2024-02-23', 'weekly', today) == date(2024, 3, 8)
+    assert db.calculate_last_expected_habit_due_date('2024-03-01', 'weekly', today) == date(2024, 3, 8)
+    assert db.calculate_last_expected_habit_due_date('2024-03-02', 'weekly', today) == date(2024, 3, 2)
+    assert db.calculate_last_expected_habit_due_date('2024-03-01', 'daily', today) == date(2024, 3, 1)
+
+def test_uses_the_clock_by_default(monkeypatch):
+    class SimulatedDate(date):
+        @classmethod
+        def today(cls):
+            return cls(2025, 6, 15)
+
+    monkeypatch.setattr(db, 'date', SimulatedDate)
+    today = SimulatedDate.today()
+    for periodicity in PERIODICITIES:
+        for completion in ('2019-01-01', '2025-06-08', '2025-06-15', '2025-07-01', None):
+            expected = reference_due_date(completion, periodicity, today)
+            assert db.calculate_last_expected_habit_due_date(completion, periodicity) == expected
+
+def test_batched_matches_single():
+    today = date(2025, 1, 31)
+    habits = [{'last_completion_date': db.get_db_date(today - timedelta(days=days)), 'periodicity': periodicity}
+              for days in (0, 1, 29, 30, 31, 400) for periodicity in PERIODICITIES]
+    habits.append({'last_completion_date': None, 'periodicity': 'weekly'})
+    assert db.calculate_habit_due_dates(habits, today) == [
+        reference_due_date(habit['last_completion_date'], habit['periodicity'], today) for habit in habits
+    ]
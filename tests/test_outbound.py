@@ -0,0 +1,136 @@
+"""
+OutboundPolicy and CircuitBreaker against a local stand-in server (see conftest.py) that fails
+on demand: 503 responses, responses that never come, and recovery.
+"""
+import time
+
+import pytest
+import requests
+
+import outbound
+from outbound import CircuitBreaker, CircuitOpenError, OutboundPolicy, RetryBudget
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(outbound, 'get_backoff', lambda retry: 0)
+
+def make_policy(timeout=(1, 0.2), max_retries=3, retries=100, threshold=100, reset_timeout=60):
+    return OutboundPolicy('test', timeout=timeout, max_retries=max_retries,
+                          budget=RetryBudget(retries=retries),
+                          breaker=CircuitBreaker('test', threshold=threshold, reset_timeout=reset_timeout))
+
+def get(policy, server, **kwargs):
+    return policy.call(
+        requests.get, server.url, timeout=policy.timeout,
+        is_transient=lambda error: isinstance(error, (requests.ConnectionError, requests.Timeout)),
+        is_failure=lambda response: response.status_code >= 500,
+        **kwargs,
+    )
+
+def test_unavailable_is_retried_then_returned(server):
+    server.mode = 'unavailable'
+    policy = make_policy(max_retries=3)
+    assert get(policy, server).status_code == 503
+    assert server.requests == 4
+
+def test_retry_budget_runs_out(server):
+    server.mode = 'unavailable'
+    policy = make_policy(max_retries=5, retries=2)
+    assert get(policy, server).status_code == 503
+    assert server.requests == 3
+    # Budget spent: later calls get a single attempt each
+    assert get(policy, server).status_code == 503
+    assert server.requests == 4
+    policy.reset_budget()
+    get(policy, server)
+    assert server.requests == 7
+
+def test_read_timeout_is_enforced(server):
+    server.mode = 'hang'
+    policy = make_policy(timeout=(1, 0.2), max_retries=1)
+    start = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        get(policy, server)
+    assert time.monotonic() - start < 1.5
+    assert server.requests == 2
+
+def test_breaker_opens_half_opens_and_closes(server):
+    server.mode = 'unavailable'
+    policy = make_policy(max_retries=0, threshold=3, reset_timeout=0.3)
+    breaker = policy.breaker
+    for _ in range(2):
+        get(policy, server)
+        assert breaker.state == CircuitBreaker.CLOSED
+    get(policy, server)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.is_open()
+
+    # Refused without reaching the service while open
+    with pytest.raises(CircuitOpenError):
+        get(policy, server)
+    assert server.requests == 3
+
+    # After reset_timeout a failing trial call re-opens the circuit
+    time.sleep(0.35)
+    get(policy, server)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert server.requests == 4
+
+    # A successful trial call closes it
+    time.sleep(0.35)
+    server.mode = 'ok'
+    assert get(policy, server).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not breaker.is_open()
+
+def test_hung_service_opens_breaker_during_retries(server):
+    server.mode = 'hang'
+    policy = make_policy(max_retries=5, threshold=2)
+    with pytest.raises(requests.Timeout):
+        get(policy, server)
+    # The retries stop as soon as the circuit opens
+    assert server.requests == 2
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker('test', threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_not_idempotent_call_is_not_retried_after_timeout(server):
+    server.mode = 'hang'
+    policy = make_policy(max_retries=3)
+    with pytest.raises(requests.Timeout):
+        get(policy, server, idempotent=False, is_unsent=lambda failure: isinstance(failure, requests.Response))
+    # The service may have processed the request, so it is not sent again
+    assert server.requests == 1
+
+def test_not_idempotent_call_is_retried_when_unsent(server):
+    server.mode = 'unavailable'
+    policy = make_policy(max_retries=2)
+    get(policy, server, idempotent=False, is_unsent=lambda failure: isinstance(failure, requests.Response))
+    assert server.requests == 3
+
+def test_ntfy_retries_only_requests_that_were_not_sent(server):
+    from notifications import is_unsent
+
+    server.mode = 'hang'
+    with pytest.raises(requests.Timeout) as timeout:
+        requests.post(server.url, timeout=(1, 0.2))
+    assert not is_unsent(timeout.value)
+
+    server.mode = 'unavailable'
+    assert is_unsent(requests.post(server.url))
+    server.mode = 'ok'
+    assert not is_unsent(requests.post(server.url))
+
+    refused_url = server.url
+    server.shutdown()
+    server.server_close()
+    with pytest.raises(requests.ConnectionError) as refused:
+        requests.post(refused_url, timeout=(1, 0.2))
+    assert is_unsent(refused.value)
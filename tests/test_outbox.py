@@ -0,0 +1,110 @@
+"""
+Outbox delivery (notifications.deliver_outbox) against a local stand-in ntfy server (see conftest.py).
+"""
+import time
+
+import pytest
+
+import db
+import notifications
+import outbound
+from outbound import CircuitBreaker, OutboundPolicy, RetryBudget
+
+@pytest.fixture(autouse=True)
+def outbox_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DATABASE', str(tmp_path / 'outbox.db'))
+    db.close_db()
+    db.migrate_db()
+    yield
+    db.close_db()
+    db.reset_cache()
+
+@pytest.fixture
+def ntfy(server, monkeypatch):
+    """The stand-in server as ntfy, with a fresh policy: short timeouts, no backoff, breaker out of the way."""
+    monkeypatch.setenv('NTFY_SERVER', server.url)
+    monkeypatch.setenv('NTFY_TOPIC', 'test')
+    monkeypatch.setattr(notifications, 'ntfy_policy', make_policy())
+    monkeypatch.setattr(outbound, 'get_backoff', lambda retry: 0)
+    return server
+
+def make_policy(threshold=100, max_retries=0):
+    return OutboundPolicy('ntfy', timeout=(1, 0.3), max_retries=max_retries, budget=RetryBudget(),
+                          breaker=CircuitBreaker('ntfy', threshold=threshold))
+
+def queue(*messages):
+    """Queue one notification per message, each for a new overdue task. Returns the task ids."""
+    task_ids = [db.insert_task(f'Task {message}', '2000-01-01') for message in messages]
+    db.enqueue_notifications([(task_id, message, {'Title': message}) for task_id, message in zip(task_ids, messages)])
+    return task_ids
+
+def get_outbox():
+    return [dict(row) for row in db.get_db().execute(
+        'SELECT task_id, message, status, attempts, next_attempt_at, last_error FROM notification_outbox ORDER BY id')]
+
+def test_possibly_delivered_notification_is_not_sent_again(ntfy):
+    ntfy.mode = 'hang'
+    task_id, = queue('slow')
+    assert notifications.deliver_outbox()['uncertain'] == 1
+    assert get_outbox()[0]['status'] == 'uncertain'
+    # Counts as notified for the day, so it is neither retried nor queued again
+    assert db.get_task(task_id)['last_notification'] is not None
+    ntfy.mode = 'ok'
+    assert not any(notifications.deliver_outbox().values())
+    assert ntfy.requests == 1
+
+def test_unsent_notification_is_retried(ntfy):
+    queue('refused')
+    ntfy.shutdown()
+    ntfy.server_close()
+    assert notifications.deliver_outbox()['retrying'] == 1
+    row, = get_outbox()
+    assert row['status'] == 'pending' and row['attempts'] == 1 and row['next_attempt_at'] > time.time()
+
+def test_open_circuit_does_not_use_up_attempts(ntfy, monkeypatch):
+    monkeypatch.setattr(notifications, 'ntfy_policy', make_policy(threshold=1))
+    ntfy.mode = 'unavailable'
+    queue('first', 'second')
+    results = notifications.deliver_outbox(max_workers=1)
+    assert results['retrying'] == 1 and results['postponed'] == 1
+    first, second = get_outbox()
+    assert first['attempts'] == 1
+    # The second was refused by the open circuit, never sent
+    assert second['status'] == 'pending' and second['attempts'] == 0
+    assert second['next_attempt_at'] >= time.time() + notifications.ntfy_policy.breaker.reset_timeout - 5
+    assert ntfy.requests == 1
+
+def test_delivery_is_concurrent_but_bounded(ntfy):
+    ntfy.delay = 0.2
+    queue(*(f'message {i}' for i in range(9)))
+    start = time.monotonic()
+    results = notifications.deliver_outbox(max_workers=3)
+    elapsed = time.monotonic() - start
+    assert results == {'sent': 9, 'retrying': 0, 'failed': 0, 'uncertain': 0, 'postponed': 0}
+    assert ntfy.max_active == 3
+    # Three rounds of 0.2s, not nine
+    assert elapsed < 9 * ntfy.delay
+    assert all(row['status'] == 'sent' for row in get_outbox())
+
+def test_mixed_results_are_settled_per_notification(ntfy):
+    ntfy.mode = lambda body: 'unavailable' if body.startswith('bad') else 'ok'
+    queue('good 1', 'bad 1', 'good 2', 'bad 2', 'good 3')
+    results = notifications.deliver_outbox(max_workers=4)
+    assert results == {'sent': 3, 'retrying': 2, 'failed': 0, 'uncertain': 0, 'postponed': 0}
+    statuses = {row['message']: (row['status'], row['attempts']) for row in get_outbox()}
+    assert statuses == {
+        'good 1': ('sent', 1), 'good 2': ('sent', 1), 'good 3': ('sent', 1),
+        'bad 1': ('pending', 1), 'bad 2': ('pending', 1),
+    }
+    assert sorted(ntfy.bodies) == ['bad 1', 'bad 2', 'good 1', 'good 2', 'good 3']
+
+def test_timeouts_do_not_hold_up_other_notifications(ntfy):
+    ntfy.mode = lambda body: 'hang' if body.startswith('slow') else 'ok'
+    queue('slow 1', 'fast 1', 'fast 2', 'slow 2')
+    start = time.monotonic()
+    results = notifications.deliver_outbox(max_workers=4)
+    # Bounded by the 0.3s read timeout, not the 2s the server hangs for
+    assert time.monotonic() - start < 1.5
+    assert results == {'sent': 2, 'retrying': 0, 'failed': 0, 'uncertain': 2, 'postponed': 0}
+    statuses = {row['message']: row['status'] for row in get_outbox()}
+    assert statuses == {'slow 1': 'uncertain', 'fast 1': 'sent', 'fast 2': 'sent', 'slow 2': 'uncertain'}
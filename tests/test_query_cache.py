@@ -0,0 +1,85 @@
+"""
+The query cache: entries are served only while the tables they read keep their versions.
+"""
+import sqlite3
+import threading
+
+import pytest
+
+import db
+
+@pytest.fixture(autouse=True)
+def cache_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DATABASE', str(tmp_path / 'cache.db'))
+    db.close_db()
+    db.migrate_db()
+    db.insert_task('Priority', '2024-01-01')
+    db.get_db().execute('UPDATE tasks SET priority = 1')
+    db.get_db().commit()
+    yield
+    db.release_table_versions()
+    db.close_db()
+    db.reset_cache()
+
+def in_request(func):
+    """Run func the way a request does: with a table version snapshot, in a new thread."""
+    result = []
+    def run():
+        db.snapshot_table_versions()
+        try:
+            result.append(func())
+        finally:
+            db.release_table_versions()
+            db.close_db()
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return result[0]
+
+def test_unrelated_write_keeps_entries():
+    db.get_priority_task()
+    hits = db.get_cache_stats()['hits']
+    db.insert_note('Note', 'text', 'idea', '2024-01-01')
+    db.get_priority_task()
+    assert db.get_cache_stats()['hits'] == hits + 1
+
+def test_write_from_another_process_is_seen_by_new_threads():
+    assert in_request(db.get_priority_task)['description'] == 'Priority'
+    other = sqlite3.connect(db.DATABASE)
+    other.execute("UPDATE tasks SET description = 'Changed'")
+    other.commit()
+    other.close()
+    assert in_request(db.get_priority_task)['description'] == 'Changed'
+
+def test_own_write_is_seen_later_in_the_request():
+    def request():
+        task = db.get_priority_task()
+        db.update_task(task['id'], {'description': 'Renamed'})
+        return task['description'], db.get_priority_task()['description']
+    assert in_request(request) == ('Priority', 'Renamed')
+
+def test_snapshot_is_read_once_per_request():
+    def request():
+        db.get_priority_task()
+        db.reset_query_stats()
+        db.get_priority_task()
+        db.get_data_version()
+        return db.get_query_stats().queries
+    assert in_request(request) == 0
+
+def test_stale_result_is_not_stored():
+    versions = db.get_table_versions()
+    db.snapshot_table_versions()
+    # Another thread commits and reads the newer version while this request still uses its snapshot
+    in_request(lambda: db.insert_task('Other', '2024-01-01'))
+    in_request(db.get_table_versions)
+    entries = db.get_cache_stats()['entries']
+    db.get_tasks()
+    assert db.get_cache_stats()['entries'] == entries
+    assert db.get_table_versions() == versions
+
+def test_reads_in_a_transaction_are_not_cached():
+    with db.transaction():
+        db.insert_task('Uncommitted', '2024-01-01')
+        assert len(db.get_tasks()) == 2
+    assert db.get_cache_stats()['entries'] == 0
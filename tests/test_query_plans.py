@@ -0,0 +1,74 @@
+"""
+The query plan check behind `flask check-indexes`, run against a freshly migrated database.
+"""
+from datetime import date
+
+import pytest
+
+import db
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = db.connect(str(tmp_path / 'plans.db'))
+    db.migrate_db(conn)
+    yield conn
+    conn.close()
+
+def test_hot_queries_use_indexes(conn):
+    assert db.check_query_plans(conn) == {}
+
+def test_query_builders():
+    sql, params = db.build_tasks_query(limit=10, after=('2024-01-01', 5), today=date(2024, 2, 1))
+    assert 'UNION ALL' in sql and params == [0, '2024-01-01', 5, 0, '2024-02-01', '2024-01-01', 5, 10]
+    sql, params = db.build_notes_query(after=('2024-01-01', 5), note_type='idea')
+    assert 'type = ?' in sql and params[-3:] == ['idea', '2024-01-01', 5]
+
+def test_dropped_index_is_reported(conn):
+    conn.execute('DROP INDEX idx_task_actions_task_date')
+    assert list(db.check_query_plans(conn)) == ['get_actions']
+
+@pytest.mark.parametrize('line, unexpected', [
+    ('SCAN tasks', True),
+    ('SCAN CONSTANT ROW', False),
+    ('SEARCH tasks USING INDEX idx_tasks_open (give_up=? AND completion_date=?)', False),
+    ('SEARCH tasks USING INDEX idx_tasks_give_up_due_date (give_up=? AND due_date>?)', True),
+    ('USE TEMP B-TREE FOR ORDER BY', True),
+    ('MERGE (UNION ALL)', False),
+])
+def test_unexpected_steps(line, unexpected):
+    assert bool(db.get_unexpected_steps([line], ('idx_tasks_open',))) == unexpected
+
+def test_wrong_index_is_reported(conn, monkeypatch):
+    # A query that moved to another index fails even though it still uses one
+    monkeypatch.setitem(db.INDEXED_QUERIES, 'get_priority_task',
+                        (lambda: (db.PRIORITY_TASK_SQL, ()), ('idx_tasks_completed_due_date',)))
+    assert list(db.check_query_plans(conn)) == ['get_priority_task']
+
+def count_steps(conn, sql, params):
+    """SQLite virtual machine steps (in thousands) needed to run a query to completion."""
+    steps = []
+    conn.set_progress_handler(lambda: steps.append(1), 1000)
+    try:
+        conn.execute(sql, params).fetchall()
+    finally:
+        conn.set_progress_handler(None, 0)
+    return len(steps)
+
+def test_task_pages_do_not_read_history(conn):
+    # Years of completed tasks, the way a long-used database looks, and analyzed so the planner sees them
+    history = [(f'Old {i}', f'20{15 + i % 6}-01-{1 + i % 28:02d}', 1, f'20{15 + i % 6}-02-01', '2015-01-01')
+               for i in range(20000)]
+    conn.executemany('INSERT INTO tasks (description, due_date, completed, completion_date, created_date) '
+                     'VALUES (?, ?, ?, ?, ?)', history)
+    conn.executemany("INSERT INTO tasks (description, due_date, created_date) VALUES (?, '2024-06-01', '2024-01-01')",
+                     [(f'Open {i}',) for i in range(200)])
+    conn.commit()
+    conn.execute('ANALYZE')
+    today = date(2024, 3, 1)
+    first_page = db.build_tasks_query(limit=db.TASK_PAGE_SIZE, today=today)
+    last_shown = conn.execute('SELECT due_date, id FROM tasks WHERE completed = 0 ORDER BY due_date, id LIMIT 1 OFFSET 49').fetchone()
+    next_page = db.build_tasks_query(limit=db.TASK_PAGE_SIZE, after=tuple(last_shown), today=today)
+    assert count_steps(conn, *first_page) < 10
+    assert count_steps(conn, *next_page) < 10
+    # With statistics the planner weighs indexes differently; the plans must not change
+    assert db.check_query_plans(conn) == {}
@@ -0,0 +1,100 @@
+"""
+transaction(): several write helpers commit together, or not at all.
+"""
+import sqlite3
+
+import pytest
+
+import db
+
+@pytest.fixture(autouse=True)
+def transaction_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DATABASE', str(tmp_path / 'transactions.db'))
+    db.close_db()
+    db.migrate_db()
+    yield
+    db.release_table_versions()
+    db.close_db()
+    db.reset_cache()
+
+class Boom(Exception):
+    pass
+
+def count_rows(table):
+    """Rows committed to table, read over a separate connection."""
+    with sqlite3.connect(db.DATABASE) as other:
+        return other.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+def test_exception_rolls_back_every_write():
+    with pytest.raises(Boom):
+        with db.transaction():
+            task_id = db.insert_task('Half done', '2024-01-01')
+            db.insert_action(task_id, 'First step', '2024-01-01')
+            raise Boom
+    assert db.get_task(task_id) is None
+    assert db.get_actions(task_id) == []
+    assert count_rows('tasks') == 0
+    assert count_rows('task_actions') == 0
+    assert not db.in_transaction()
+
+def test_writes_commit_once_when_the_block_exits():
+    with db.transaction():
+        task_id = db.insert_task('Done', '2024-01-01')
+        db.insert_action(task_id, 'First step', '2024-01-01')
+        assert count_rows('tasks') == 0
+    assert count_rows('tasks') == 1
+    assert count_rows('task_actions') == 1
+
+def test_nested_block_commits_with_the_outermost():
+    with db.transaction():
+        with db.transaction():
+            task_id = db.insert_task('Inner', '2024-01-01')
+        # The inner block leaves committing to the outer one
+        assert count_rows('tasks') == 0
+        db.insert_action(task_id, 'Outer step', '2024-01-01')
+    assert count_rows('tasks') == 1
+    assert count_rows('task_actions') == 1
+
+def test_nested_block_is_rolled_back_with_the_outermost():
+    with pytest.raises(Boom):
+        with db.transaction():
+            with db.transaction():
+                task_id = db.insert_task('Inner', '2024-01-01')
+                db.insert_action(task_id, 'Inner step', '2024-01-01')
+            raise Boom
+    assert count_rows('tasks') == 0
+    assert count_rows('task_actions') == 0
+
+def test_inner_exception_caught_by_the_outer_block_still_rolls_back_at_the_end():
+    with pytest.raises(Boom):
+        with db.transaction():
+            try:
+                with db.transaction():
+                    db.insert_task('Inner', '2024-01-01')
+                    raise Boom
+            except Boom:
+                # Only the outermost block rolls back, so the inner write is still pending here
+                assert db.in_transaction()
+            raise Boom
+    assert count_rows('tasks') == 0
+
+def test_rollback_refreshes_the_snapshot_and_cache():
+    task_id = db.insert_task('Priority', '2024-01-01')
+    db.snapshot_table_versions()
+    before = db.get_table_versions()
+    assert db.get_priority_task() is None
+
+    with pytest.raises(Boom):
+        with db.transaction():
+            db.bulk_update_tasks([task_id], 'priority', priority=True)
+            # Reads inside the block see its writes, and are not cached
+            assert db.get_priority_task()['id'] == task_id
+            raise Boom
+    # The snapshot no longer holds the version of the rolled back write
+    assert db.get_table_versions() == before
+    assert db.get_priority_task() is None
+
+    with db.transaction():
+        db.bulk_update_tasks([task_id], 'priority', priority=True)
+    assert db.get_table_versions()['tasks'] > before['tasks']
+    assert db.get_priority_task()['id'] == task_id